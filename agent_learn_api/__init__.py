@@ -8,7 +8,9 @@ from flask_socketio import SocketIO
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 mail = Mail()
-socket_io = SocketIO(cors_allowed_origins="*")
+# Agent replies and ingestion progress are emitted from executor threads, which
+# only the threading mode supports (eventlet is installed but nothing is patched)
+socket_io = SocketIO(cors_allowed_origins="*", async_mode="threading")
 
 def create_app():
     app = Flask(__name__)
@@ -29,6 +31,10 @@ def create_app():
     mail.init_app(app)
     socket_io.init_app(app)
 
+    # Shared LLM response cache for every ChatOpenAI call site
+    from agent_learn_api.utils.llm_cache_utils import init_llm_cache
+    init_llm_cache()
+
     # Import blueprints
     from agent_learn_api.routes.auth import auth_bp
     from agent_learn_api.routes.chat import chat_bp
@@ -38,6 +44,7 @@ def create_app():
     from agent_learn_api.routes.question import question_bp
     from agent_learn_api.routes.mindmap import mindmap_bp
     from agent_learn_api.routes.ai_doc import ai_doc_bp
+    from agent_learn_api.routes.stats import stats_bp
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix="/auth")
@@ -48,5 +55,12 @@ def create_app():
     app.register_blueprint(question_bp, url_prefix="/questions")
     app.register_blueprint(mindmap_bp, url_prefix="/mindmaps")
     app.register_blueprint(ai_doc_bp, url_prefix="/aidocs")
+    app.register_blueprint(stats_bp, url_prefix="/stats")
+
+    # CLI commands (flask traces ..., flask index ..., flask ingest ...)
+    from agent_learn_api.commands import index_cli, ingest_cli, traces_cli
+    app.cli.add_command(traces_cli)
+    app.cli.add_command(index_cli)
+    app.cli.add_command(ingest_cli)
 
     return app
@@ -3,16 +3,19 @@ from agent_learn_api.config import Config
 from agent_learn_api import socket_io
 from flask_cors import CORS
 
-app = create_app()
+# Worker processes started fresh (PDF extraction) re-import this script as
+# __mp_main__; they only need the module, not another app
+if __name__ != "__mp_main__":
+    app = create_app()
 
-# Enable CORS for the frontend
-CORS(
-    app,
-    resources={r"/*": {"origins": "*"}},
-    supports_credentials=True,
-    allow_headers=["Content-Type", "Authorization"],
-    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-)
+    # Enable CORS for the frontend
+    CORS(
+        app,
+        resources={r"/*": {"origins": "*"}},
+        supports_credentials=True,
+        allow_headers=["Content-Type", "Authorization"],
+        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+import click
+from flask.cli import AppGroup
+from agent_learn_api.utils.trace_utils import TRACE_LOG_PATH, report_from_file
+from agent_learn_api.utils.index_utils import (
+    INDEX_PACK_MAX_VECTORS, benchmark_codecs, benchmark_index_kinds, measure_cold_load, migrate_workspace,
+    pack_workspace, read_manifest, requantize_workspace, workspace_ids, workspace_vectors,
+)
+from agent_learn_api.utils.pdf_utils import PDF_WORKERS, benchmark_pdf
+from agent_learn_api.utils.segment_utils import INDEX_CODECS
+
+# --- Trace reports ---
+traces_cli = AppGroup("traces", help="Inspect recorded latency spans.")
+
+
+@traces_cli.command("report")
+@click.option("--path", default=TRACE_LOG_PATH, show_default=True, help="JSONL span log to read.")
+def traces_report(path):
+    """Print p50/p95/p99 latency, tokens and cache hits per span kind."""
+    try:
+        report = report_from_file(path)
+    except FileNotFoundError:
+        click.echo(f"❌ No trace log at {path}")
+        return
+
+    click.echo(f"{'kind':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'tokens':>10}{'cached':>8}{'errors':>8}")
+    for kind, row in sorted(report.items()):
+        click.echo(
+            f"{kind:<12}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            f"{row['tokens']:>10}{row['cache_hits']:>8}{row['errors']:>8}"
+        )
+
+
+# --- Workspace index maintenance ---
+index_cli = AppGroup("index", help="Maintain workspace vector indexes.")
+
+
+@index_cli.command("migrate")
+@click.option("--workspace", type=int, default=None, help="Only migrate this workspace.")
+def index_migrate(workspace):
+    """Convert pickled LangChain indexes to mmap segments with a SQLite docstore."""
+    for ws in [workspace] if workspace else workspace_ids():
+        before = measure_cold_load(ws)
+        converted = migrate_workspace(ws)
+        if not converted:
+            click.echo(f"workspace {ws}: nothing to migrate")
+            continue
+        after = measure_cold_load(ws)
+        click.echo(
+            f"workspace {ws}: {converted} segment(s), {after['vectors']} vectors, "
+            f"cold load {before['load_ms']} -> {after['load_ms']} ms, "
+            f"resident {before['resident_bytes']} -> {after['resident_bytes']} bytes"
+        )
+
+
+@index_cli.command("benchmark")
+@click.option("--workspace", type=int, default=None, help="Only benchmark this workspace.")
+@click.option("--queries", type=int, default=200, show_default=True)
+@click.option("--k", type=int, default=5, show_default=True)
+def index_benchmark(workspace, queries, k):
+    """Compare flat, HNSW and IVF recall@k and latency on real workspace indexes."""
+    for ws in [workspace] if workspace else workspace_ids():
+        vectors = workspace_vectors(ws)
+        if vectors is None or len(vectors) < 2:
+            continue
+        click.echo(f"workspace {ws}: {len(vectors)} vectors")
+        click.echo(f"  {'kind':<6}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'build ms':>10}{'bytes':>12}")
+        for kind, row in benchmark_index_kinds(vectors, queries=queries, k=k).items():
+            click.echo(
+                f"  {kind:<6}{row['recall_at_k']:>8}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                f"{row['build_ms']:>10}{row['bytes']:>12}"
+            )
+
+
+@index_cli.command("quantize")
+@click.option("--codec", type=click.Choice(INDEX_CODECS), required=True,
+              help="Vector storage to rewrite workspaces with (none restores full precision).")
+@click.option("--workspace", type=int, default=None, help="Only rewrite this workspace.")
+@click.option("--dry-run", is_flag=True, help="Report the recall change without rewriting anything.")
+def index_quantize(codec, workspace, dry_run):
+    """Rewrite workspace indexes with compressed vectors and report bytes saved and recall delta."""
+    saved = 0
+    for ws in [workspace] if workspace else workspace_ids():
+        vectors = workspace_vectors(ws)
+        if vectors is None or len(vectors) < 2:
+            continue
+        baseline = benchmark_codecs(vectors, "none")
+        quantized = benchmark_codecs(vectors, codec)
+        line = (
+            f"workspace {ws}: {len(vectors)} vectors, {quantized['kind']}/{quantized['codec']}, "
+            f"recall@k {baseline['recall_at_k']} -> {quantized['recall_at_k']} "
+            f"({quantized['recall_at_k_reranked']} re-ranked)"
+        )
+        if not dry_run:
+            result = requantize_workspace(ws, codec)
+            if result:
+                saved += result["bytes_before"] - result["bytes_after"]
+                line += f", {result['bytes_before']} -> {result['bytes_after']} bytes"
+        click.echo(line)
+    if not dry_run:
+        click.echo(f"total saved: {saved} bytes")
+
+
+@index_cli.command("pack")
+@click.option("--workspace", type=int, default=None, help="Only pack this workspace.")
+@click.option("--dry-run", is_flag=True, help="List the workspaces that would be packed.")
+def index_pack(workspace, dry_run):
+    """Move small workspaces from their own index directories into shared pack shards."""
+    packed, chunks = 0, 0
+    for ws in [workspace] if workspace else workspace_ids():
+        manifest = read_manifest(ws)
+        if not manifest:
+            continue
+        vectors = sum(s.get("vectors") or 0 for s in manifest["segments"])
+        if dry_run:
+            if vectors <= INDEX_PACK_MAX_VECTORS:
+                click.echo(f"workspace {ws}: {vectors} vectors in {len(manifest['segments'])} segment(s)")
+            continue
+        moved = pack_workspace(ws)
+        if moved is not None:
+            packed += 1
+            chunks += moved
+            click.echo(f"workspace {ws}: packed {moved} chunks")
+    if not dry_run:
+        click.echo(f"✅ Packed {packed} workspace(s), {chunks} chunks")
+
+
+# --- Document ingestion ---
+ingest_cli = AppGroup("ingest", help="Measure document ingestion.")
+
+
+@ingest_cli.command("benchmark-pdf")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--workers", default=f"1,2,{PDF_WORKERS}", show_default=True,
+              help="Comma-separated process pool sizes to compare.")
+def ingest_benchmark_pdf(path, workers):
+    """Compare in-process and parallel text extraction on a (large) PDF."""
+    counts = [int(w) for w in workers.split(",") if w.strip()]
+    rows = benchmark_pdf(path, counts)
+    serial_ms = rows[0]["ms"]
+    click.echo(f"{'workers':>8}{'pages':>8}{'ms':>10}{'pages/s':>10}{'speedup':>9}{'same text':>11}")
+    for row in rows:
+        speedup = round(serial_ms / row["ms"], 2) if row["ms"] else 0.0
+        click.echo(
+            f"{row['workers']:>8}{row['pages']:>8}{row['ms']:>10}{row['pages_per_s']:>10}"
+            f"{speedup:>9}{'yes' if row['matches_serial'] else 'NO':>11}"
+        )
@@ -0,0 +1,54 @@
+"""Add agent checkpoint tables
+
+Revision ID: 3f8d2b6e9c14
+Revises: 7e4c1b9d3a58
+Create Date: 2026-10-17 19:41:05.512930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d2b6e9c14'
+down_revision = '7e4c1b9d3a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('agent_checkpoints',
+    sa.Column('thread_id', sa.String(length=200), nullable=False),
+    sa.Column('checkpoint_ns', sa.String(length=200), nullable=False),
+    sa.Column('checkpoint_id', sa.String(length=64), nullable=False),
+    sa.Column('parent_checkpoint_id', sa.String(length=64), nullable=True),
+    sa.Column('checkpoint_type', sa.String(length=32), nullable=False),
+    sa.Column('checkpoint', sa.LargeBinary(), nullable=False),
+    sa.Column('metadata_type', sa.String(length=32), nullable=False),
+    sa.Column('metadata', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id')
+    )
+    with op.batch_alter_table('agent_checkpoints', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_agent_checkpoints_created_at'), ['created_at'], unique=False)
+
+    op.create_table('agent_checkpoint_writes',
+    sa.Column('thread_id', sa.String(length=200), nullable=False),
+    sa.Column('checkpoint_ns', sa.String(length=200), nullable=False),
+    sa.Column('checkpoint_id', sa.String(length=64), nullable=False),
+    sa.Column('task_id', sa.String(length=64), nullable=False),
+    sa.Column('idx', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=200), nullable=False),
+    sa.Column('value_type', sa.String(length=32), nullable=False),
+    sa.Column('value', sa.LargeBinary(), nullable=False),
+    sa.Column('task_path', sa.String(length=500), nullable=False),
+    sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx')
+    )
+
+
+def downgrade():
+    op.drop_table('agent_checkpoint_writes')
+    with op.batch_alter_table('agent_checkpoints', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_agent_checkpoints_created_at'))
+
+    op.drop_table('agent_checkpoints')
@@ -0,0 +1,28 @@
+"""Add generation timings to chat messages
+
+Revision ID: 4c1e9a7d2b10
+Revises: afcf46b870a3
+Create Date: 2026-10-17 10:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e9a7d2b10'
+down_revision = 'afcf46b870a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ttft_ms', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('generation_ms', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.drop_column('generation_ms')
+        batch_op.drop_column('ttft_ms')
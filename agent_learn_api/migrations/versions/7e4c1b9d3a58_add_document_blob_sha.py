@@ -0,0 +1,28 @@
+"""Add content hash to documents
+
+Revision ID: 7e4c1b9d3a58
+Revises: d2a7c5e8f130
+Create Date: 2026-10-17 16:02:47.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4c1b9d3a58'
+down_revision = 'd2a7c5e8f130'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_sha', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_documents_blob_sha'), ['blob_sha'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_documents_blob_sha'))
+        batch_op.drop_column('blob_sha')
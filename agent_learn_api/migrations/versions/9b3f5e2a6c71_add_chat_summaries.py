@@ -0,0 +1,35 @@
+"""Add rolling chat summaries
+
+Revision ID: 9b3f5e2a6c71
+Revises: 4c1e9a7d2b10
+Create Date: 2026-10-17 11:03:17.204661
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3f5e2a6c71'
+down_revision = '4c1e9a7d2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('last_chat_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('workspace_id', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('chat_summaries')
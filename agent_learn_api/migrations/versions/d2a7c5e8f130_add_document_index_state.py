@@ -0,0 +1,28 @@
+"""Add indexing state to documents
+
+Revision ID: d2a7c5e8f130
+Revises: 9b3f5e2a6c71
+Create Date: 2026-10-17 14:26:09.731842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e8f130'
+down_revision = '9b3f5e2a6c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('index_state', sa.String(length=20), server_default='indexed', nullable=False))
+        batch_op.add_column(sa.Column('index_error', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_column('index_error')
+        batch_op.drop_column('index_state')
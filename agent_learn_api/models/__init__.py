@@ -5,6 +5,7 @@ from .verification_codes import VerificationCode
 from .workspace import Workspace
 from .document import Document
 from .chat import Chat
+from .chat_summary import ChatSummary
 from .question import Question
 from .quiz import Quiz, QuizResult
 
@@ -14,6 +15,7 @@ __all__ = [
     "Workspace",
     "Document",
     "Chat",
+    "ChatSummary",
     "Question",
     "Quiz",
     "QuizResult"
@@ -7,6 +7,9 @@ class Chat(db.Model):
     role = db.Column(db.String(20), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # Assistant replies only: time to first streamed token and total generation time
+    ttft_ms = db.Column(db.Integer, nullable=True)
+    generation_ms = db.Column(db.Integer, nullable=True)
     
     workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
\ No newline at end of file
@@ -0,0 +1,14 @@
+from agent_learn_api import db
+
+class ChatSummary(db.Model):
+    __tablename__ = "chat_summaries"
+    __table_args__ = (db.UniqueConstraint("workspace_id", "user_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    content = db.Column(db.Text, nullable=False, default="")
+    # Highest chat_messages.id folded into the summary
+    last_chat_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
+    workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
@@ -7,5 +7,10 @@ class Document(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     uploaded_at = db.Column(db.DateTime, server_default = db.func.now())
+    # queued -> parse -> chunk -> embed -> index -> indexed, or failed
+    index_state = db.Column(db.String(20), nullable=False, server_default="indexed")
+    index_error = db.Column(db.Text, nullable=True)
+    # sha256 of the uploaded bytes; shared by every document with the same content
+    blob_sha = db.Column(db.String(64), nullable=True, index=True)
     
     workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=False)
\ No newline at end of file
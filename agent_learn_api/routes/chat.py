@@ -1,11 +1,95 @@
-from flask import Blueprint, request, jsonify
+import os
+import uuid
+from flask import Blueprint, request, jsonify, current_app
 from agent_learn_api import db, socket_io
 from agent_learn_api.models.chat import Chat
-from agent_learn_api.utils.agent_utils import run_agent
+from agent_learn_api.models.chat_summary import ChatSummary
+from agent_learn_api.utils.cache_utils import LRUCache
+from agent_learn_api.utils.agent_utils import run_agent_timed, run_agent_stream
+from agent_learn_api.utils.executor_utils import agent_executor, ExecutorBusyError
 from flask_socketio import emit
 
 chat_bp = Blueprint("chat", __name__)
 
+# Replies kept for the status endpoint after they are delivered
+CHAT_JOB_HISTORY = int(os.getenv("CHAT_JOB_HISTORY", "500"))
+reply_jobs = LRUCache(max_entries=CHAT_JOB_HISTORY)  # message_id -> {"state", "assistant_message", ...}
+
+
+def _message_payload(chat: Chat, **extra) -> dict:
+    return {
+        "id": chat.id,
+        "role": chat.role,
+        "content": chat.content,
+        "workspace_id": chat.workspace_id,
+        "user_id": chat.user_id,
+        "created_at": chat.created_at.isoformat(),
+        **extra,
+    }
+
+
+def _queue_reply(app, workspace_id: int, user_id: int, content: str, message_id: str, on_chunk=None):
+    """
+    Queue the assistant reply to `content`. Once it is ready it is saved and
+    sent as a receive_message event carrying `message_id`, and the reply job
+    is updated. Raises ExecutorBusyError when the agent queue is full.
+    """
+    # Recorded first: a fast run may finish before submit returns
+    reply_jobs.put(message_id, {"job_id": message_id, "state": "queued", "assistant_message": None})
+    try:
+        if on_chunk is not None:
+            future = agent_executor.submit(
+                workspace_id, run_agent_stream, workspace_id, user_id, content, on_chunk, app=app
+            )
+        else:
+            future = agent_executor.submit(workspace_id, run_agent_timed, workspace_id, user_id, content, app=app)
+    except ExecutorBusyError:
+        reply_jobs.pop(message_id)
+        raise
+
+    def on_done(done):
+        try:
+            response_text, timings = done.result()
+            state = "done"
+        except Exception as e:
+            print("Agent error:", e)
+            response_text = "⚠️ Error: Agent failed to generate response."
+            timings = {"ttft_ms": None, "generation_ms": None}
+            state = "failed"
+
+        # Store assistant reply
+        with app.app_context():
+            assistant_chat = Chat(
+                role="assistant",
+                content=response_text,
+                workspace_id=workspace_id,
+                user_id=user_id,
+                ttft_ms=timings["ttft_ms"],
+                generation_ms=timings["generation_ms"],
+            )
+            db.session.add(assistant_chat)
+            db.session.commit()
+            response_payload = _message_payload(
+                assistant_chat,
+                message_id=message_id,
+                ttft_ms=assistant_chat.ttft_ms,
+                generation_ms=assistant_chat.generation_ms,
+            )
+
+        reply_jobs.put(message_id, {"job_id": message_id, "state": state, "assistant_message": response_payload})
+        socket_io.emit("receive_message", response_payload)
+
+    future.add_done_callback(on_done)
+
+
+def _withdraw_message(chat: Chat):
+    """Delete a user message whose reply could not be queued, telling clients that already showed it."""
+    payload = {"id": chat.id, "workspace_id": chat.workspace_id, "user_id": chat.user_id}
+    db.session.delete(chat)
+    db.session.commit()
+    socket_io.emit("message_deleted", payload)
+
+
 # --- Add new chat message (REST) ---
 @chat_bp.route("/", methods=["POST"])
 def add_message():
@@ -28,57 +112,36 @@ def add_message():
     db.session.add(chat)
     db.session.commit()
 
-    # Notify all connected clients
-    socket_io.emit("receive_message", {
-        "id": chat.id,
-        "role": chat.role,
-        "content": chat.content,
-        "workspace_id": workspace_id,
-        "user_id": user_id,
-        "created_at": chat.created_at.isoformat()
-    }, broadcast=True)
+    # Notify all connected clients before a (possibly cached) reply can follow
+    socket_io.emit("receive_message", _message_payload(chat), broadcast=True)
 
-    # Run AI agent to generate assistant response
+    # Queue the AI agent run; reject instead of queueing without limit
+    message_id = uuid.uuid4().hex
     try:
-        response = run_agent(int(workspace_id), int(user_id), content)
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": f"Agent failed: {str(e)}"}), 500
-
-    # Save assistant message
-    response_chat = Chat(
-        role="assistant",
-        content=response,
-        workspace_id=int(workspace_id),
-        user_id=int(user_id)
-    )
-    db.session.add(response_chat)
-    db.session.commit()
-
-    # Emit assistant message via WebSocket
-    socket_io.emit("receive_message", {
-        "id": response_chat.id,
-        "role": response_chat.role,
-        "content": response_chat.content,
-        "workspace_id": workspace_id,
-        "user_id": user_id,
-        "created_at": response_chat.created_at.isoformat()
-    }, broadcast=True)
+        _queue_reply(current_app._get_current_object(), int(workspace_id), int(user_id), content, message_id)
+    except ExecutorBusyError as e:
+        _withdraw_message(chat)
+        return jsonify({"error": "busy", "details": str(e)}), 503
 
+    # The reply arrives as a receive_message event with this message_id, or from the job endpoint
     return jsonify({
+        "job_id": message_id,
         "user_message": {
             "id": chat.id,
             "role": chat.role,
             "content": chat.content,
             "created_at": chat.created_at
         },
-        "assistant_message": {
-            "id": response_chat.id,
-            "role": response_chat.role,
-            "content": response_chat.content,
-            "created_at": response_chat.created_at
-        }
-    }), 201
+    }), 202
+
+
+# --- Assistant reply status (REST) ---
+@chat_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_reply_job(job_id):
+    job = reply_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job), 200
 
 
 # --- Get all chat messages for a workspace ---
@@ -107,6 +170,8 @@ def get_messages(workspace_id):
 @chat_bp.route("/<int:workspace_id>", methods=["DELETE"])
 def delete_messages(workspace_id):
     deleted = Chat.query.filter_by(workspace_id=workspace_id).delete()
+    # The summaries describe the deleted messages
+    ChatSummary.query.filter_by(workspace_id=workspace_id).delete()
     db.session.commit()
     return jsonify({"message": f"{deleted} messages deleted"}), 200
 
@@ -118,50 +183,35 @@ def handle_send_message(data):
     content = data.get("content")
     workspace_id = int(data.get("workspace_id"))
     user_id = int(data.get("user_id", 0))
+    app = current_app._get_current_object()
 
-    # 1️⃣ Store user message
+    # 1️⃣ Store and broadcast the user message, ahead of any reply to it
     chat = Chat(role=role, content=content, workspace_id=int(workspace_id), user_id=int(user_id))
     db.session.add(chat)
     db.session.commit()
+    emit("receive_message", _message_payload(chat), broadcast=True)
 
-    message_payload = {
-        "id": chat.id,
-        "role": chat.role,
-        "content": chat.content,
-        "workspace_id": workspace_id,
-        "user_id": user_id,
-        "created_at": chat.created_at.isoformat(),
-    }
+    # 2️⃣ Queue the assistant response (streamed as receive_message_chunk when requested)
+    message_id = uuid.uuid4().hex
 
-    # Broadcast the user message immediately
-    emit("receive_message", message_payload, broadcast=True)
+    def send_chunk(text, seq):
+        socket_io.emit("receive_message_chunk", {
+            "message_id": message_id,
+            "seq": seq,
+            "delta": text,
+            "workspace_id": workspace_id,
+            "user_id": user_id,
+        })
 
-    # 2️⃣ Generate assistant response
+    stream = data.get("stream") and agent_executor.supports_streaming
     try:
-        response_text = run_agent(workspace_id, user_id, content)
-    except Exception as e:
-        print("Agent error:", e)
-        response_text = "⚠️ Error: Agent failed to generate response."
-
-    # 3️⃣ Store assistant reply
-    assistant_chat = Chat(
-        role="assistant",
-        content=response_text,
-        workspace_id=int(workspace_id),
-        user_id=user_id,
-    )
-    db.session.add(assistant_chat)
-    db.session.commit()
-
-    response_payload = {
-        "id": assistant_chat.id,
-        "role": assistant_chat.role,
-        "content": assistant_chat.content,
-        "workspace_id": workspace_id,
-        "user_id": user_id,
-        "created_at": assistant_chat.created_at.isoformat(),
-    }
-
-    # 4️⃣ Emit assistant message too
-    emit("receive_message", response_payload, broadcast=True)
-
+        # 3️⃣ The reply is stored and emitted once the run finishes
+        _queue_reply(app, workspace_id, user_id, content, message_id, on_chunk=send_chunk if stream else None)
+    except ExecutorBusyError as e:
+        _withdraw_message(chat)
+        emit("busy", {
+            "workspace_id": workspace_id,
+            "user_id": user_id,
+            "content": content,
+            "error": str(e),
+        })
@@ -1,12 +1,15 @@
 import os
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, current_app
 from flask.helpers import send_file
 from werkzeug.utils import secure_filename
 from agent_learn_api import db
 from agent_learn_api.models.document import Document
-from agent_learn_api.utils.document_utils import add_to_index
+from agent_learn_api.utils.agent_utils import invalidate_workspace_agents
+from agent_learn_api.utils.blob_utils import UPLOAD_DIR, adopt_blob, blob_lock, receive_upload, release_blob
+from agent_learn_api.utils.executor_utils import ExecutorBusyError
+from agent_learn_api.utils.index_utils import delete_document_vectors
+from agent_learn_api.utils.ingest_utils import get_job, resume_interrupted_ingests, submit_ingest
 
-UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 document_bp = Blueprint("document", __name__)
@@ -25,33 +28,86 @@ def upload_document():
         return jsonify({"error": "workspace_id is required"}), 400
 
     filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    file.save(file_path)
+    # Stored once per distinct content; re-uploads reuse the earlier parse and embeddings
+    sha, tmp_path = receive_upload(file.stream)
+
+    error = None
+    with blob_lock:
+        file_path, reused = adopt_blob(sha, tmp_path, os.path.splitext(filename)[1].lower())
+        existing = Document.query.filter(
+            Document.workspace_id == int(workspace_id),
+            Document.blob_sha == sha,
+            Document.index_state != "failed",
+        ).first()
+        if existing is None:
+            try:
+                # Save metadata in DB; indexing happens in the background
+                doc = Document(
+                    filename=filename,
+                    file_path=file_path,
+                    workspace_id=int(workspace_id),
+                    index_state="queued",
+                    blob_sha=sha
+                )
+                db.session.add(doc)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(e)
+                error = e
+
+    if existing is not None:
+        # Same bytes already in this workspace: nothing to index
+        return jsonify({
+            "message": "Document already uploaded to this workspace",
+            "id": existing.id,
+            "filename": existing.filename,
+            "file_path": existing.file_path,
+            "index_state": existing.index_state,
+            "duplicate": True
+        }), 200
+    if error is not None:
+        release_blob(sha)
+        return jsonify({"error": str(error)}), 500
 
     try:
-        # Index file (text or image)
-        add_to_index(file_path, int(workspace_id))
-
-        # Save metadata in DB
-        doc = Document(
-            filename=filename,
-            file_path=file_path,
-            workspace_id=workspace_id
-        )
-        db.session.add(doc)
+        job = submit_ingest(doc, current_app._get_current_object())
+    except ExecutorBusyError as e:
+        db.session.delete(doc)
         db.session.commit()
-
-        return jsonify({
-            "message": "Document uploaded and indexed",
-            "id": doc.id,
-            "filename": doc.filename,
-            "file_path": doc.file_path
-        }), 201
-
+        release_blob(sha)
+        return jsonify({"error": "busy", "detail": str(e)}), 503
+
+    return jsonify({
+        "message": "Document uploaded, indexing started",
+        "id": doc.id,
+        "job_id": job.id,
+        "filename": doc.filename,
+        "file_path": doc.file_path,
+        "index_state": doc.index_state,
+        "reused": reused
+    }), 202
+
+
+# --- Documents left mid-ingestion by the last shutdown ---
+@document_bp.before_app_request
+def resume_ingestion():
+    # Runs on the first request, so only in processes that serve the app
+    # (not the reloader's watcher, CLI commands or agent worker processes)
+    try:
+        resume_interrupted_ingests(current_app._get_current_object())
     except Exception as e:
         db.session.rollback()
-        print(e)
-        return jsonify({"error": str(e)}), 500
+        print("❌ Could not resume interrupted ingestion:", e)
+
+
+# --- Ingestion job status ---
+@document_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_ingest_job(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job.to_dict()), 200
 
 
 # --- Get all documents ---
@@ -65,7 +121,9 @@ def get_documents(workspace_id):
             "id": d.id,
             "filename": d.filename,
             "file_path": d.file_path,
-            "uploaded_at": d.uploaded_at
+            "uploaded_at": d.uploaded_at,
+            "index_state": d.index_state,
+            "index_error": d.index_error
         }
         for d in docs
     ]), 200
@@ -78,8 +136,21 @@ def delete_document(doc_id):
     if not doc:
         return jsonify({"error": f"Document {doc_id} not found"}), 404
 
+    workspace_id = doc.workspace_id
+    blob_sha = doc.blob_sha
+    # Chunks indexed before document ids were recorded can only be matched by file path
+    shared = Document.query.filter(
+        Document.workspace_id == workspace_id,
+        Document.file_path == doc.file_path,
+        Document.id != doc.id,
+    ).count()
+    source = None if shared else doc.file_path
+
     db.session.delete(doc)
     db.session.commit()
+    delete_document_vectors(workspace_id, doc_id, source)
+    release_blob(blob_sha)
+    invalidate_workspace_agents(workspace_id)
     return jsonify({"message": f"Document {doc_id} deleted"}), 200
 
 
@@ -96,6 +167,15 @@ def get_preview():
     upload_dir_abs = os.path.abspath(UPLOAD_DIR)
     file_path = os.path.realpath(os.path.join(upload_dir_abs, filename))
 
+    if not os.path.exists(file_path):
+        # Uploads are stored under their content hash; resolve the original name
+        query = Document.query.filter_by(filename=filename)
+        if data.get("workspace_id"):
+            query = query.filter_by(workspace_id=int(data["workspace_id"]))
+        doc = query.order_by(Document.uploaded_at.desc()).first()
+        if doc:
+            file_path = os.path.realpath(doc.file_path)
+
     # ✅ secure path check
     if not file_path.startswith(upload_dir_abs):
         return jsonify({"error": "Forbidden: outside upload directory"}), 403
@@ -0,0 +1,87 @@
+from flask import Blueprint, jsonify
+from agent_learn_api.utils.agent_utils import get_agent_cache_stats
+from agent_learn_api.utils.router_utils import get_router_stats
+from agent_learn_api.utils.executor_utils import agent_executor
+from agent_learn_api.utils.delegation_utils import recent_delegations
+from agent_learn_api.utils.llm_cache_utils import get_llm_cache_stats
+from agent_learn_api.utils.client_utils import get_client_stats
+from agent_learn_api.utils.index_utils import get_index_stats
+from agent_learn_api.utils.embedding_cache_utils import get_embedding_cache_stats
+from agent_learn_api.utils.ingest_utils import get_ingest_stats
+from agent_learn_api.utils.blob_utils import get_blob_stats
+from agent_learn_api.utils.image_utils import get_ocr_stats
+from agent_learn_api.utils.trace_utils import get_trace_report
+
+stats_bp = Blueprint("stats", __name__)
+
+
+# --- Agent graph cache counters ---
+@stats_bp.route("/agents", methods=["GET"])
+def agent_stats():
+    return jsonify(get_agent_cache_stats()), 200
+
+
+# --- Tiered router hit rates and latency ---
+@stats_bp.route("/router", methods=["GET"])
+def router_stats():
+    return jsonify(get_router_stats()), 200
+
+
+# --- Agent worker pool queue depth ---
+@stats_bp.route("/executor", methods=["GET"])
+def executor_stats():
+    return jsonify(agent_executor.stats()), 200
+
+
+# --- Delegation trees of recent requests ---
+@stats_bp.route("/delegation", methods=["GET"])
+def delegation_stats():
+    return jsonify(recent_delegations()), 200
+
+
+# --- Shared LLM response cache ---
+@stats_bp.route("/llm-cache", methods=["GET"])
+def llm_cache_stats():
+    return jsonify(get_llm_cache_stats()), 200
+
+
+# --- Shared model client pool ---
+@stats_bp.route("/clients", methods=["GET"])
+def client_stats():
+    return jsonify(get_client_stats()), 200
+
+
+# --- Latency percentiles per span kind ---
+@stats_bp.route("/traces", methods=["GET"])
+def trace_stats():
+    return jsonify(get_trace_report()), 200
+
+
+# --- Loaded index segments and compactions ---
+@stats_bp.route("/indexes", methods=["GET"])
+def index_stats():
+    return jsonify(get_index_stats()), 200
+
+
+# --- Embedding cache reuse across workspaces ---
+@stats_bp.route("/embeddings", methods=["GET"])
+def embedding_stats():
+    return jsonify(get_embedding_cache_stats()), 200
+
+
+# --- Background document ingestion ---
+@stats_bp.route("/ingest", methods=["GET"])
+def ingest_stats():
+    return jsonify(get_ingest_stats()), 200
+
+
+# --- Content-addressed uploads and de-duplication ---
+@stats_bp.route("/uploads", methods=["GET"])
+def upload_stats():
+    return jsonify(get_blob_stats()), 200
+
+
+# --- Image OCR cache and preprocessing savings ---
+@stats_bp.route("/ocr", methods=["GET"])
+def ocr_stats():
+    return jsonify(get_ocr_stats()), 200
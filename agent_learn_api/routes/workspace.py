@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
-from agent_learn_api import db
+from flask_socketio import join_room, leave_room
+from agent_learn_api import db, socket_io
+from agent_learn_api.models.chat_summary import ChatSummary
+from agent_learn_api.models.document import Document
 from agent_learn_api.models.workspace import Workspace
+from agent_learn_api.utils.agent_utils import invalidate_workspace_agents
+from agent_learn_api.utils.blob_utils import release_blob
+from agent_learn_api.utils.checkpoint_utils import delete_workspace_checkpoints
+from agent_learn_api.utils.index_utils import delete_workspace_index
+from agent_learn_api.utils.ingest_utils import workspace_room
 
 workspace_bp = Blueprint("workspace", __name__)
 
@@ -28,6 +36,27 @@ def get_workspaces(user_id):
 # --- Delete workspace ---
 @workspace_bp.route("/<int:workspace_id>", methods=["DELETE"])
 def delete_workspace(workspace_id):
+    documents = Document.query.filter_by(workspace_id=workspace_id)
+    blobs = {d.blob_sha for d in documents}
+    documents.delete()
+    ChatSummary.query.filter_by(workspace_id=workspace_id).delete()
     deleted = Workspace.query.filter_by(id=workspace_id).delete()
     db.session.commit()
+    invalidate_workspace_agents(workspace_id)
+    delete_workspace_checkpoints(workspace_id)
+    delete_workspace_index(workspace_id)
+    # Uploads shared with other workspaces stay until their last document goes
+    for sha in blobs:
+        release_blob(sha)
     return jsonify({"message": f"Workspace {workspace_id} deleted"}), 200
+
+
+# --- WebSocket events: workspace rooms (ingestion progress) ---
+@socket_io.on("join_workspace")
+def handle_join_workspace(data):
+    join_room(workspace_room(int(data.get("workspace_id"))))
+
+
+@socket_io.on("leave_workspace")
+def handle_leave_workspace(data):
+    leave_room(workspace_room(int(data.get("workspace_id"))))
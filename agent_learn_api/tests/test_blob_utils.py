@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_sqlalchemy")
+
+from flask import Flask
+from langchain.schema import Document as Chunk
+from agent_learn_api import db
+from agent_learn_api.models import Document
+from agent_learn_api.utils import blob_utils
+from agent_learn_api.utils.cache_utils import SqliteStore
+
+SHA = "ab" + "0" * 62
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_utils, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_utils, "parsed_store", SqliteStore(str(tmp_path / "parsed.sqlite"), table="parsed_blobs"))
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _document(name):
+    document = Document(filename=name, file_path=blob_utils.blob_path(SHA, ".txt"), workspace_id=1, blob_sha=SHA)
+    db.session.add(document)
+    db.session.commit()
+    return document
+
+
+def test_blob_is_released_with_its_last_document(app):
+    path = blob_utils.blob_path(SHA, ".txt")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("shared bytes")
+    blob_utils.put_parsed(SHA, [Chunk(page_content="shared bytes", metadata={})])
+
+    first, second = _document("a.txt"), _document("b.txt")
+    assert blob_utils.blob_refs(SHA) == 2
+
+    db.session.delete(first)
+    db.session.commit()
+    assert not blob_utils.release_blob(SHA)
+    assert os.path.exists(path)
+    assert blob_utils.get_parsed(SHA)
+
+    db.session.delete(second)
+    db.session.commit()
+    assert blob_utils.release_blob(SHA)
+    assert not os.path.exists(path)
+    assert blob_utils.get_parsed(SHA) is None
+
+
+def test_missing_sha_is_never_released(app):
+    assert not blob_utils.release_blob(None)
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("langgraph")
+
+from langgraph.checkpoint.base import empty_checkpoint
+from agent_learn_api.utils.checkpoint_utils import SQLCheckpointSaver
+
+THREAD = "workspace-1:user-1"
+
+
+def _put(saver, checkpoint_id, checkpoint_ns=""):
+    checkpoint = empty_checkpoint()
+    # Ids are time ordered in LangGraph; fixed-width strings keep that order here
+    checkpoint["id"] = f"{checkpoint_id:06d}"
+    config = {"configurable": {"thread_id": THREAD, "checkpoint_ns": checkpoint_ns}}
+    saved = saver.put(config, checkpoint, {}, {})
+    saver.put_writes(saved, [("messages", checkpoint_id)], task_id=f"task-{checkpoint_id}")
+    return saved
+
+
+def _ids(saver, checkpoint_ns):
+    config = {"configurable": {"thread_id": THREAD, "checkpoint_ns": checkpoint_ns}}
+    return sorted(int(t.config["configurable"]["checkpoint_id"]) for t in saver.list(config))
+
+
+def test_trim_keeps_newest_root_checkpoints_and_their_subgraph_runs():
+    saver = SQLCheckpointSaver("sqlite://", max_per_thread=3, max_age=3600, create_tables=True)
+
+    # Root checkpoint, then a subgraph run that writes to its own namespace, repeated
+    for run in range(5):
+        base = run * 10
+        _put(saver, base)
+        _put(saver, base + 1, checkpoint_ns=f"agent:task-{run}")
+        _put(saver, base + 2, checkpoint_ns=f"agent:task-{run}")
+
+    assert _ids(saver, "") == [20, 30, 40]
+    # Runs older than the oldest kept root checkpoint are gone in every namespace
+    assert _ids(saver, "agent:task-0") == []
+    assert _ids(saver, "agent:task-1") == []
+    assert _ids(saver, "agent:task-2") == [21, 22]
+    assert _ids(saver, "agent:task-4") == [41, 42]
+
+    latest = saver.get_tuple({"configurable": {"thread_id": THREAD, "checkpoint_ns": "agent:task-4"}})
+    assert latest.pending_writes == [("task-42", "messages", 42)]
+
+
+def test_trim_waits_for_enough_root_checkpoints():
+    saver = SQLCheckpointSaver("sqlite://", max_per_thread=3, max_age=3600, create_tables=True)
+    _put(saver, 1, checkpoint_ns="agent:task-0")
+    _put(saver, 2)
+    _put(saver, 3)
+
+    assert _ids(saver, "") == [2, 3]
+    assert _ids(saver, "agent:task-0") == [1]
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+
+from agent_learn_api.utils.executor_utils import ExecutorBusyError, WorkspaceExecutor
+
+
+def test_runs_of_one_workspace_execute_in_submission_order():
+    executor = WorkspaceExecutor(kind="thread", workers=4, max_pending=16)
+    order = []
+    release = threading.Event()
+
+    def run(i):
+        # The first run blocks so the rest pile up behind it
+        if i == 0:
+            release.wait(5)
+        order.append(i)
+        return i
+
+    futures = [executor.submit(1, run, i) for i in range(6)]
+    release.set()
+    assert [f.result(timeout=5) for f in futures] == list(range(6))
+    assert order == list(range(6))
+    assert executor.stats()["completed"] == 6
+
+
+def test_other_workspaces_are_not_held_up():
+    executor = WorkspaceExecutor(kind="thread", workers=2, max_pending=4)
+    release = threading.Event()
+    blocked = executor.submit(1, release.wait, 5)
+    assert executor.submit(2, lambda: "done").result(timeout=5) == "done"
+    release.set()
+    assert blocked.result(timeout=5)
+
+
+def test_submit_beyond_max_pending_is_rejected():
+    executor = WorkspaceExecutor(kind="thread", workers=1, max_pending=2)
+    release = threading.Event()
+    futures = [executor.submit(1, release.wait, 5), executor.submit(2, release.wait, 5)]
+
+    with pytest.raises(ExecutorBusyError):
+        executor.submit(3, release.wait, 5)
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    for f in futures:
+        f.result(timeout=5)
+    # Finished runs free their slots
+    assert executor.submit(3, lambda: 3).result(timeout=5) == 3
@@ -0,0 +1,91 @@
+import pytest
+
+pytest.importorskip("faiss")
+
+from agent_learn_api.utils.index_utils import INDEX_COMPACT_DELETED_RATIO, needs_compaction
+
+
+def _manifest(segments, deleted=0):
+    return {
+        "version": 1,
+        "segments": [{"name": f"seg-{i}", "kind": "flat", "vectors": n, "bytes": 0} for i, n in enumerate(segments)],
+        "tombstones": {"documents": [1], "sources": [], "vectors": deleted} if deleted else {},
+    }
+
+
+def test_single_segment_with_many_deleted_vectors_is_compacted():
+    total = 1000
+    assert needs_compaction(_manifest([total], deleted=int(total * INDEX_COMPACT_DELETED_RATIO) + 1))
+
+
+def test_single_segment_with_few_deleted_vectors_is_left_alone():
+    assert not needs_compaction(_manifest([1000], deleted=1))
+    assert not needs_compaction(_manifest([1000]))
+
+
+def test_empty_manifest_is_left_alone():
+    assert not needs_compaction(_manifest([]))
+
+
+def test_tombstoned_flat_pq_segment_is_searchable(tmp_path):
+    np = pytest.importorskip("numpy")
+    from langchain.schema import Document
+    from agent_learn_api.utils.segment_utils import INDEX_PQ_MIN_TRAIN, Segment, write_segment_files
+
+    rng = np.random.default_rng(0)
+    vectors = rng.random((INDEX_PQ_MIN_TRAIN, 16), dtype=np.float32)
+    docs = [Document(page_content=f"chunk {i}", metadata={"document_id": i % 2}) for i in range(len(vectors))]
+    path = str(tmp_path / "seg")
+    assert write_segment_files(path, vectors, docs, kind="flat", codec="pq") == "pq"
+
+    segment = Segment(path)
+    excluded = segment.deleted_positions((0,))
+    assert len(excluded) == len(vectors) // 2
+    distances, positions = segment.search(vectors[:3], 5, excluded)
+    hits = positions[positions >= 0]
+    assert len(hits) == 15
+    assert not set(hits.tolist()) & set(excluded.tolist())
+    segment.close()
+
+
+def test_deleted_document_is_hidden_at_once_and_compacted_away(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from langchain.schema import Document
+    from agent_learn_api.utils import index_utils
+
+    # Relative index paths resolve under tmp_path; compaction is run by hand below
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(index_utils, "maybe_compact", lambda workspace_id, manifest=None: None)
+    workspace_id = 9001
+
+    rng = np.random.default_rng(1)
+    vectors = rng.random((20, 8), dtype=np.float32)
+    docs = [
+        Document(page_content=f"chunk {i}", metadata={"document_id": i % 2, "source": f"doc-{i % 2}.txt"})
+        for i in range(len(vectors))
+    ]
+    segment = index_utils.write_segment(workspace_id, vectors, docs, codec="none")
+    index_utils.write_manifest(workspace_id, {"version": 1, "segments": [segment], "tombstones": {}})
+
+    def found_documents():
+        index = index_utils.load_workspace_index(workspace_id)
+        hits = index.similarity_search_with_score_by_vector(vectors[0].tolist(), k=len(vectors))
+        return {doc.metadata["document_id"] for doc, _ in hits}
+
+    try:
+        assert found_documents() == {0, 1}
+
+        assert index_utils.delete_document_vectors(workspace_id, 0) == len(vectors) // 2
+        assert found_documents() == {1}
+
+        manifest = index_utils.read_manifest(workspace_id)
+        assert index_utils.needs_compaction(manifest)
+        assert index_utils.compact_workspace(workspace_id) == 1
+
+        manifest = index_utils.read_manifest(workspace_id)
+        assert [s["vectors"] for s in manifest["segments"]] == [len(vectors) // 2]
+        assert manifest["tombstones"]["documents"] == []
+        assert manifest["tombstones"]["vectors"] == 0
+        assert found_documents() == {1}
+    finally:
+        index_utils.evict_workspace_index(workspace_id)
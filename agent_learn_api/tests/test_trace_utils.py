@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("flask")
+
+from agent_learn_api.utils.trace_utils import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 11))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 95) == 10
+    assert percentile(values, 100) == 10
+
+
+def test_percentile_of_unsorted_values():
+    assert percentile([30, 10, 20], 50) == 20
+    assert percentile([30, 10, 20], 0) == 10
+
+
+def test_percentile_of_empty_list():
+    assert percentile([], 95) == 0.0
@@ -1,12 +1,22 @@
 import os
+import time
 import openai
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
 from agent_learn_api.utils.document_utils import *
 from agent_learn_api.utils.google_utils import *
 from agent_learn_api.utils.llm_utils import *
 from agent_learn_api.utils.quiz_utils import *
 from agent_learn_api.utils.treemap_utils import *
+from agent_learn_api.utils.cache_utils import LRUCache
+from agent_learn_api.utils.client_utils import get_chat_model
+from agent_learn_api.utils.checkpoint_utils import get_checkpointer, thread_id_for
+from agent_learn_api.utils.delegation_utils import (
+    DelegationLimitError, current_tracker, track_request,
+)
+from agent_learn_api.utils.history_utils import load_history_window
+from agent_learn_api.utils.stream_utils import current_sink, stream_or_invoke, stream_to
+from agent_learn_api.utils.router_utils import DESTINATIONS, CentroidClassifier, route_query
+from agent_learn_api.utils.trace_utils import span
 from agent_learn_api.models.chat import Chat
 from langchain.schema import HumanMessage, AIMessage
 from langchain.tools import Tool
@@ -14,13 +24,17 @@ from langchain_core.output_parsers import PydanticOutputParser, JsonOutputParser
 from langchain.prompts import PromptTemplate
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 
 # --- Setup ---
 load_dotenv(find_dotenv())
 openai.api_key = os.getenv("OPENAI_API_KEY")
-model = ChatOpenAI(temperature=0.9, model="gpt-4o")
+model = get_chat_model("gpt-4o", temperature=0.9)
+
+# Compiled routing graphs are reused per (workspace_id, user_id)
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "128"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "1800"))
+graph_cache = LRUCache(max_entries=AGENT_CACHE_SIZE, ttl=AGENT_CACHE_TTL)
 
 # --- State models ---
 class AgentBase(BaseModel):
@@ -41,33 +55,49 @@ class ToolCall(BaseModel):
     tool_input: str = Field(description="The input or final answer")
 
 # --- Delegation between agents ---
+def _invoke_agent(target, query: str) -> str:
+    # invoke with message-based input for LangGraph compatibility
+    response = target.invoke({"messages": [HumanMessage(content=query)]})
+
+    # Normalize the result into plain text
+    if isinstance(response, dict):
+        if "output" in response and isinstance(response["output"], str):
+            return response["output"]
+        elif "messages" in response and isinstance(response["messages"], list):
+            # flatten message contents if returned as messages
+            return "\n".join(
+                [m.content for m in response["messages"] if hasattr(m, "content")]
+            )
+        else:
+            return str(response)
+
+    elif hasattr(response, "content"):
+        return response.content
+
+    return str(response)
+
 def delegate_to_agent(agent_name: str, query: str, agents_map: dict):
     """Delegate a query to another agent and safely return string output."""
     target = agents_map.get(agent_name)
     if not target:
         return f"[Error] Unknown agent '{agent_name}'"
 
-    try:
-        # invoke with message-based input for LangGraph compatibility
-        response = target.invoke({"messages": [HumanMessage(content=query)]})
-
-        # Normalize the result into plain text
-        if isinstance(response, dict):
-            if "output" in response and isinstance(response["output"], str):
-                return response["output"]
-            elif "messages" in response and isinstance(response["messages"], list):
-                # flatten message contents if returned as messages
-                return "\n".join(
-                    [m.content for m in response["messages"] if hasattr(m, "content")]
-                )
-            else:
-                return str(response)
-
-        elif hasattr(response, "content"):
-            return response.content
-
-        return str(response)
+    tracker = current_tracker()
+    if tracker:
+        cached = tracker.lookup(agent_name, query)
+        if cached is not None:
+            return cached
 
+    try:
+        if tracker:
+            with tracker.delegate(agent_name, query):
+                text = _invoke_agent(target, query)
+            tracker.remember(agent_name, query, text)
+            return text
+        return _invoke_agent(target, query)
+
+    except DelegationLimitError as e:
+        return f"[Delegation to {agent_name} stopped: {e}. Answer with what you have.]"
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -87,21 +117,16 @@ def get_delegation_tools(agents_map: dict):
 
 # --- Chat history loader ---
 def load_chat_history(user_id: int, workspace_id: int):
-    history = []
-    chats = (
-        Chat.query.filter_by(user_id=user_id, workspace_id=workspace_id)
-        .order_by(Chat.created_at.asc())
-        .all()
-    )
-    for chat in chats:
-        if chat.role == "user":
-            history.append(HumanMessage(content=chat.content))
-        else:
-            history.append(AIMessage(content=chat.content))
-    return history
+    # Rolling summary + last HISTORY_WINDOW messages, within HISTORY_TOKEN_BUDGET
+    return load_history_window(user_id=user_id, workspace_id=workspace_id)
 
 # --- Core LLM call ---
 def call_llm(state: AgentBase, tool_list):
+    with span("call_llm", tools=len(tool_list)):
+        return _call_llm(state, tool_list)
+
+
+def _call_llm(state: AgentBase, tool_list):
     tool_names = [t.name for t in tool_list]
 
     prompt = PromptTemplate(
@@ -125,7 +150,19 @@ def call_llm(state: AgentBase, tool_list):
     parser = JsonOutputParser(pydantic_object=ToolCall)
     chain = prompt | model | parser
 
-    raw = chain.invoke({"input": state.input})
+    sink = current_sink()
+    if sink is None:
+        raw = chain.invoke({"input": state.input})
+    else:
+        # Stream the decision and forward the answer text once we know no tool is needed
+        raw, sent = {}, 0
+        for partial in chain.stream({"input": state.input}):
+            raw = partial
+            if isinstance(partial, dict) and partial.get("tool") == "NONE":
+                answer = partial.get("tool_input") or ""
+                sink.push(answer[sent:])
+                sent = len(answer)
+    pushed_before_tool = sink.seq if sink else 0
 
     # ✅ Force into ToolCall object
     if isinstance(raw, dict):
@@ -139,7 +176,8 @@ def call_llm(state: AgentBase, tool_list):
     tool = next((t for t in tool_list if t.name == parsed.tool), None)
     if tool:
         try:
-            raw_result = tool.func(parsed.tool_input)
+            with span("tool", tool.name):
+                raw_result = tool.func(parsed.tool_input)
             if isinstance(raw_result, list):
                 summarizer = (
                     PromptTemplate.from_template(
@@ -148,14 +186,20 @@ def call_llm(state: AgentBase, tool_list):
                     | model
                     | StrOutputParser()
                 )
-                result = summarizer.invoke({"snippets": "\n".join(str(r) for r in raw_result)})
+                result = stream_or_invoke(summarizer, {"snippets": "\n".join(str(r) for r in raw_result)})
             else:
                 result = str(raw_result)
+        except DelegationLimitError:
+            raise
         except Exception as e:
             result = f"[Tool {parsed.tool} failed: {e}]"
     else:
         result = f"[Unknown tool {parsed.tool}]"
 
+    # Tools that cannot stream (quiz, mindmap, search...) send their result as one chunk
+    if sink and sink.seq == pushed_before_tool:
+        sink.push(result)
+
     return {**state.model_dump(), "output": result}
 
 
@@ -180,7 +224,8 @@ def build_agent(tool_list: list, agents_map):
     builder.add_edge("call_llm", END)
     builder.add_edge(START, "call_llm")
 
-    return builder.compile(checkpointer=MemorySaver())
+    # Agents run as subgraphs and inherit the routing graph's checkpointer
+    return builder.compile()
 
 
 
@@ -268,14 +313,7 @@ def get_agents(workspace_id: int, user_id: int):
 
 # --- Router ---
 def get_router():
-    destinations = [
-        "quiz_agent",
-        "doc_agent",
-        "mindmap_agent",
-        "google_agent",
-        "chat_agent"
-    ]
-    destinations_str = "\n".join(destinations)
+    destinations_str = "\n".join(DESTINATIONS)
 
     # ✅ Parser ensures we always get {destination, next_inputs}
     output_parser = PydanticOutputParser(pydantic_object=RouterOutput)
@@ -300,13 +338,23 @@ def get_router():
     return router_chain
 
 
+# The router prompt offers "chat_agent" but the general agent is registered as "llm_agent"
+ROUTE_ALIASES = {"chat_agent": "llm_agent"}
+centroid_router = CentroidClassifier(embeddings)
+
+
 def get_router_node():
     router_chain = get_router()
 
+    def llm_route(query: str) -> RouterOutput:
+        return router_chain.invoke({"input": query})
+
     def router_node(state: AgentBase):
-        raw: RouterOutput = router_chain.invoke({"input": state.input})
-        state.route = raw.destination
-        state.next_inputs = raw.next_inputs
+        with span("router", "router_node") as current:
+            decision = route_query(state.input, centroid_router, llm_route)
+            current["attrs"].update(tier=decision.tier, destination=decision.destination)
+        state.route = ROUTE_ALIASES.get(decision.destination, decision.destination)
+        state.next_inputs = decision.next_inputs or {"input": state.input}
         return state
 
     return router_node
@@ -325,12 +373,31 @@ def build_routing_graph(workspace_id: int, user_id: int):
         builder.add_edge(node, END)
     builder.add_edge(START, "router")
 
-    return builder.compile()
+    return builder.compile(checkpointer=get_checkpointer())
+
+
+def get_routing_graph(workspace_id: int, user_id: int):
+    """Return the cached routing graph for a workspace/user, building it on a miss."""
+    key = (workspace_id, user_id)
+    graph = graph_cache.get(key)
+    if graph is None:
+        graph = build_routing_graph(workspace_id=workspace_id, user_id=user_id)
+        graph_cache.put(key, graph)
+    return graph
+
+
+def invalidate_workspace_agents(workspace_id: int) -> int:
+    """Drop cached graphs for a workspace, e.g. after its documents change."""
+    return graph_cache.invalidate(lambda key: key[0] == workspace_id)
+
+
+def get_agent_cache_stats() -> dict:
+    return graph_cache.stats()
 
 # --- Run agent ---
 def run_agent(workspace_id: int, user_id: int, query: str):
     history = load_chat_history(user_id=user_id, workspace_id=workspace_id)
-    agent = build_routing_graph(workspace_id=workspace_id, user_id=user_id)
+    agent = get_routing_graph(workspace_id=workspace_id, user_id=user_id)
 
     # Construct proper LangGraph state
     state = {
@@ -339,12 +406,42 @@ def run_agent(workspace_id: int, user_id: int, query: str):
         "messages": [HumanMessage(content=query)]
     }
 
+    # One checkpoint thread per workspace/user conversation
+    config = {"configurable": {"thread_id": thread_id_for(workspace_id, user_id)}}
+
     try:
-        result = agent.invoke(state)
+        with span("run_agent", workspace_id=workspace_id, user_id=user_id), \
+                track_request(workspace_id, user_id, query):
+            snapshot = agent.get_state(config)
+            if snapshot.next and snapshot.values.get("input") == query:
+                # A previous run of this message stopped part-way: resume after its last completed step
+                result = agent.invoke(None, config)
+            else:
+                result = agent.invoke(state, config)
         print("✅ Agent result:", result)
         return result.get("output", str(result))
+    except DelegationLimitError as e:
+        print("❌ Agent stopped:", str(e))
+        return f"⚠️ I had to stop before finishing this request ({e}). Try asking for less at once."
     except Exception as e:
         import traceback
         traceback.print_exc()
         print("❌ Detailed Agent error:", str(e))
         return f"Agent error: {e}"
+
+
+def run_agent_timed(workspace_id: int, user_id: int, query: str):
+    """Run the agent without streaming and return the answer with its generation time."""
+    started = time.perf_counter()
+    output = run_agent(workspace_id, user_id, query)
+    return output, {"ttft_ms": None, "generation_ms": int((time.perf_counter() - started) * 1000)}
+
+
+def run_agent_stream(workspace_id: int, user_id: int, query: str, on_chunk):
+    """
+    Run the agent while pushing answer chunks to `on_chunk(text, seq)`.
+    Returns the final answer and its timings in milliseconds.
+    """
+    with stream_to(on_chunk) as sink:
+        output = run_agent(workspace_id, user_id, query)
+    return output, {"ttft_ms": sink.ttft_ms, "generation_ms": sink.generation_ms}
@@ -0,0 +1,140 @@
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import threading
+from dotenv import load_dotenv, find_dotenv
+from langchain.schema import Document as Chunk
+from agent_learn_api.models.document import Document
+from agent_learn_api.utils.cache_utils import SqliteStore
+
+load_dotenv(find_dotenv())
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Uploads are stored once per distinct content, under the sha256 of their bytes
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(UPLOAD_DIR, "blobs"))
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", os.path.join(CACHE_DIR, "parsed.sqlite"))
+# Larger documents are streamed through ingestion without keeping their chunks
+PARSE_CACHE_MAX_CHARS = int(os.getenv("PARSE_CACHE_MAX_CHARS", str(8 * 1024 * 1024)))
+_READ_SIZE = 1 << 20
+
+# Held while a blob is linked to a new Document or removed, so a blob is
+# never collected between an upload finding it and its row being committed
+blob_lock = threading.Lock()
+parsed_store = None
+_parsed_lock = threading.Lock()
+_counters = {"uploads": 0, "reused": 0, "reused_bytes": 0, "collected": 0}
+
+
+def _store() -> SqliteStore:
+    global parsed_store
+    with _parsed_lock:
+        if parsed_store is None:
+            parsed_store = SqliteStore(PARSE_CACHE_PATH, table="parsed_blobs")
+        return parsed_store
+
+
+def blob_path(sha: str, ext: str) -> str:
+    # Loaders pick a parser by extension, so it is kept on the blob name
+    return os.path.join(BLOB_DIR, sha[:2], sha + ext)
+
+
+def receive_upload(stream) -> tuple:
+    """Copy an upload stream to a temporary file while hashing it. Returns (sha256, temp path)."""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = stream.read(_READ_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return digest.hexdigest(), tmp_path
+
+
+def adopt_blob(sha: str, tmp_path: str, ext: str) -> tuple:
+    """
+    Move a received upload to its content address, or drop it if those bytes
+    are already stored. Call with `blob_lock` held. Returns (path, reused).
+    """
+    path = blob_path(sha, ext)
+    size = os.path.getsize(tmp_path)
+    _counters["uploads"] += 1
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+        _counters["reused"] += 1
+        _counters["reused_bytes"] += size
+        return path, True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return path, False
+
+
+def blob_refs(sha: str) -> int:
+    """Documents, across all workspaces, that point at this blob."""
+    return Document.query.filter_by(blob_sha=sha).count()
+
+
+def release_blob(sha: str | None) -> bool:
+    """Remove a blob and its parse results once no document references it."""
+    if not sha:
+        return False
+    with blob_lock:
+        if blob_refs(sha):
+            return False
+        for path in glob.glob(os.path.join(BLOB_DIR, sha[:2], sha + "*")):
+            os.remove(path)
+        _store().delete(sha)
+        _counters["collected"] += 1
+    return True
+
+
+# --- Parse results shared by every document with the same bytes ---
+def get_parsed(sha: str | None) -> list[Chunk] | None:
+    if not sha:
+        return None
+    raw = _store().get(sha)
+    if raw is None:
+        return None
+    return [Chunk(page_content=c["text"], metadata=c["metadata"]) for c in json.loads(raw)]
+
+
+def put_parsed(sha: str | None, docs: list[Chunk]):
+    if not sha or not docs:
+        return
+    payload = [{"text": d.page_content, "metadata": d.metadata} for d in docs]
+    _store().set(sha, json.dumps(payload))
+
+
+def remember_parsed(sha: str | None, chunks):
+    """
+    Pass `chunks` through, saving them for `sha` once the stream is exhausted.
+    Stops collecting once the text passes PARSE_CACHE_MAX_CHARS.
+    """
+    kept, chars = [], 0
+    for chunk in chunks:
+        if kept is not None:
+            chars += len(chunk.page_content)
+            if chars <= PARSE_CACHE_MAX_CHARS:
+                kept.append(chunk)
+            else:
+                kept = None
+        yield chunk
+    if kept:
+        put_parsed(sha, kept)
+
+
+def get_blob_stats() -> dict:
+    blobs, size = 0, 0
+    for path in glob.glob(os.path.join(BLOB_DIR, "??", "*")):
+        blobs += 1
+        size += os.path.getsize(path)
+    return {"blobs": blobs, "bytes": size, **_counters}
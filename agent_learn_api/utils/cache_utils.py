@@ -0,0 +1,211 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional idle TTL and byte budget.
+    Entries are evicted when max_entries or max_bytes is exceeded, and
+    expire when they have not been read for `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None,
+                 max_bytes: int | None = None, sizeof=None, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+
+        self._data = OrderedDict()  # key -> [value, size, last_access]
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[2] > self.ttl
+
+    def _remove(self, key, evicted: bool):
+        value, size, _ = self._data.pop(key)
+        self._bytes -= size
+        if evicted:
+            self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def _shrink(self):
+        while self._data and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest, evicted=True)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if self._expired(entry):
+                self._remove(key, evicted=True)
+                self.misses += 1
+                return default
+            entry[2] = time.monotonic()
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int | None = None):
+        if size is None:
+            size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key, evicted=False)
+            self._data[key] = [value, size, time.monotonic()]
+            self._bytes += size
+            self._shrink()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key, evicted=False)
+            self.invalidations += 1
+            return value
+
+    def invalidate(self, predicate) -> int:
+        """Drop every entry whose key matches `predicate`, return the count."""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                self._remove(k, evicted=False)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        self.invalidate(lambda k: True)
+
+    def expire(self) -> int:
+        """Evict entries past their idle TTL."""
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if self._expired(entry)]
+            for k in keys:
+                self._remove(k, evicted=True)
+            return len(keys)
+
+    def items(self):
+        with self._lock:
+            return [(k, entry[0], entry[1]) for k, entry in self._data.items()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+
+class SqliteStore:
+    """
+    Small persistent key/value table on a local SQLite file.
+    Rows remember when they were written and last read so they can be
+    pruned by age and by count.
+    """
+
+    def __init__(self, path: str, table: str = "entries"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str, max_age: float | None = None):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if max_age is not None and now - row[1] > max_age:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def prune(self, max_age: float | None = None, max_rows: int | None = None) -> int:
+        """Drop rows older than max_age, then the least recently read beyond max_rows."""
+        removed = 0
+        with self._lock:
+            if max_age is not None:
+                cur = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - max_age,)
+                )
+                removed += cur.rowcount
+            if max_rows is not None:
+                cur = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (max_rows,),
+                )
+                removed += cur.rowcount
+            self._conn.commit()
+        return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
@@ -0,0 +1,301 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv, find_dotenv
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, String, Integer, Float, LargeBinary,
+    select, delete, and_,
+)
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver, CheckpointTuple, WRITES_IDX_MAP,
+    get_checkpoint_id, get_checkpoint_metadata,
+)
+from flask import current_app
+from langgraph.checkpoint.memory import MemorySaver
+
+load_dotenv(find_dotenv())
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# "sqlite" (local file), "database" (the app's SQLALCHEMY_DATABASE_URI) or "memory".
+# The "database" tables are created by the migrations, the local file creates its own.
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", os.path.join(CACHE_DIR, "checkpoints.sqlite"))
+# Retention: newest N checkpoints per thread (subgraph checkpoints older than
+# those go with them), and nothing older than max age
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "20"))
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", str(7 * 24 * 3600)))
+# Age-based pruning runs every N checkpoint writes
+CHECKPOINT_PRUNE_EVERY = int(os.getenv("CHECKPOINT_PRUNE_EVERY", "100"))
+
+metadata_obj = MetaData()
+
+checkpoints_table = Table(
+    "agent_checkpoints", metadata_obj,
+    Column("thread_id", String(200), primary_key=True),
+    Column("checkpoint_ns", String(200), primary_key=True),
+    Column("checkpoint_id", String(64), primary_key=True),
+    Column("parent_checkpoint_id", String(64), nullable=True),
+    Column("checkpoint_type", String(32), nullable=False),
+    Column("checkpoint", LargeBinary, nullable=False),
+    Column("metadata_type", String(32), nullable=False),
+    Column("metadata", LargeBinary, nullable=False),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+writes_table = Table(
+    "agent_checkpoint_writes", metadata_obj,
+    Column("thread_id", String(200), primary_key=True),
+    Column("checkpoint_ns", String(200), primary_key=True),
+    Column("checkpoint_id", String(64), primary_key=True),
+    Column("task_id", String(64), primary_key=True),
+    Column("idx", Integer, primary_key=True),
+    Column("channel", String(200), nullable=False),
+    Column("value_type", String(32), nullable=False),
+    Column("value", LargeBinary, nullable=False),
+    Column("task_path", String(500), nullable=False, default=""),
+)
+
+
+def thread_id_for(workspace_id: int, user_id: int) -> str:
+    return f"workspace-{workspace_id}:user-{user_id}"
+
+
+class SQLCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer stored in any SQLAlchemy database.
+    Each thread keeps its newest `max_per_thread` root checkpoints plus the
+    subgraph checkpoints written since the oldest of them, and checkpoints
+    older than `max_age` seconds are pruned.
+    """
+
+    def __init__(self, url: str, max_per_thread: int = CHECKPOINT_MAX_PER_THREAD,
+                 max_age: float = CHECKPOINT_MAX_AGE, serde=None, create_tables: bool = False):
+        super().__init__(serde=serde)
+        self.engine = create_engine(url, pool_pre_ping=True)
+        if create_tables:
+            metadata_obj.create_all(self.engine)
+        self.max_per_thread = max_per_thread
+        self.max_age = max_age
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    # --- reads ---
+    def _writes_for(self, conn, thread_id, checkpoint_ns, checkpoint_id):
+        rows = conn.execute(
+            select(writes_table).where(and_(
+                writes_table.c.thread_id == thread_id,
+                writes_table.c.checkpoint_ns == checkpoint_ns,
+                writes_table.c.checkpoint_id == checkpoint_id,
+            )).order_by(writes_table.c.task_id, writes_table.c.idx)
+        ).mappings().all()
+        return [
+            (r["task_id"], r["channel"], self.serde.loads_typed((r["value_type"], r["value"])))
+            for r in rows
+        ]
+
+    def _to_tuple(self, conn, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns = row["thread_id"], row["checkpoint_ns"]
+        parent_id = row["parent_checkpoint_id"]
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": row["checkpoint_id"],
+            }},
+            checkpoint=self.serde.loads_typed((row["checkpoint_type"], row["checkpoint"])),
+            metadata=self.serde.loads_typed((row["metadata_type"], row["metadata"])),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+            pending_writes=self._writes_for(conn, thread_id, checkpoint_ns, row["checkpoint_id"]),
+        )
+
+    def get_tuple(self, config):
+        configurable = config["configurable"]
+        query = select(checkpoints_table).where(and_(
+            checkpoints_table.c.thread_id == configurable["thread_id"],
+            checkpoints_table.c.checkpoint_ns == configurable.get("checkpoint_ns", ""),
+        ))
+        if checkpoint_id := get_checkpoint_id(config):
+            query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(checkpoints_table.c.checkpoint_id.desc()).limit(1)
+        with self.engine.connect() as conn:
+            row = conn.execute(query).mappings().first()
+            return self._to_tuple(conn, row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = select(checkpoints_table)
+        if config:
+            configurable = config["configurable"]
+            query = query.where(checkpoints_table.c.thread_id == configurable["thread_id"])
+            if "checkpoint_ns" in configurable:
+                query = query.where(checkpoints_table.c.checkpoint_ns == configurable["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(checkpoints_table.c.checkpoint_id < before_id)
+        query = query.order_by(checkpoints_table.c.checkpoint_id.desc())
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).mappings().all()
+            returned = 0
+            for row in rows:
+                item = self._to_tuple(conn, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                yield item
+                returned += 1
+                if limit is not None and returned >= limit:
+                    break
+
+    # --- writes ---
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.engine.begin() as conn:
+            conn.execute(delete(checkpoints_table).where(and_(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+                checkpoints_table.c.checkpoint_id == checkpoint["id"],
+            )))
+            conn.execute(checkpoints_table.insert().values(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=configurable.get("checkpoint_id"),
+                checkpoint_type=checkpoint_type,
+                checkpoint=checkpoint_blob,
+                metadata_type=metadata_type,
+                metadata=metadata_blob,
+                created_at=time.time(),
+            ))
+            self._trim_thread(conn, thread_id)
+
+        with self._lock:
+            self._puts += 1
+            prune_due = self._puts % CHECKPOINT_PRUNE_EVERY == 0
+        if prune_due:
+            self.prune()
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        key = {
+            "thread_id": configurable["thread_id"],
+            "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+            "checkpoint_id": configurable["checkpoint_id"],
+        }
+        with self.engine.begin() as conn:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                match = and_(
+                    writes_table.c.thread_id == key["thread_id"],
+                    writes_table.c.checkpoint_ns == key["checkpoint_ns"],
+                    writes_table.c.checkpoint_id == key["checkpoint_id"],
+                    writes_table.c.task_id == task_id,
+                    writes_table.c.idx == write_idx,
+                )
+                exists = conn.execute(select(writes_table.c.idx).where(match)).first()
+                if exists and write_idx >= 0:
+                    # Regular writes are idempotent; special writes (errors, interrupts) are replaced
+                    continue
+                if exists:
+                    conn.execute(delete(writes_table).where(match))
+                value_type, value_blob = self.serde.dumps_typed(value)
+                conn.execute(writes_table.insert().values(
+                    **key, task_id=task_id, idx=write_idx, channel=channel,
+                    value_type=value_type, value=value_blob, task_path=task_path,
+                ))
+
+    # --- retention ---
+    def _delete_checkpoints(self, conn, condition):
+        ids = conn.execute(
+            select(checkpoints_table.c.thread_id, checkpoints_table.c.checkpoint_ns,
+                   checkpoints_table.c.checkpoint_id).where(condition)
+        ).all()
+        for thread_id, checkpoint_ns, checkpoint_id in ids:
+            conn.execute(delete(writes_table).where(and_(
+                writes_table.c.thread_id == thread_id,
+                writes_table.c.checkpoint_ns == checkpoint_ns,
+                writes_table.c.checkpoint_id == checkpoint_id,
+            )))
+        conn.execute(delete(checkpoints_table).where(condition))
+        return len(ids)
+
+    def _trim_thread(self, conn, thread_id):
+        # Subgraphs write to a fresh "agent:<task id>" namespace per run, so the
+        # root namespace decides what is kept. Checkpoint ids are time ordered,
+        # so everything older than its oldest kept checkpoint goes, in any namespace.
+        keep = conn.execute(
+            select(checkpoints_table.c.checkpoint_id).where(and_(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == "",
+            )).order_by(checkpoints_table.c.checkpoint_id.desc()).limit(self.max_per_thread)
+        ).scalars().all()
+        if len(keep) < self.max_per_thread:
+            return
+        self._delete_checkpoints(conn, and_(
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_id < keep[-1],
+        ))
+
+    def prune(self) -> int:
+        """Delete checkpoints older than max_age across all threads."""
+        with self.engine.begin() as conn:
+            return self._delete_checkpoints(
+                conn, checkpoints_table.c.created_at < time.time() - self.max_age
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(writes_table).where(writes_table.c.thread_id == thread_id))
+            conn.execute(delete(checkpoints_table).where(checkpoints_table.c.thread_id == thread_id))
+
+    def delete_threads_with_prefix(self, prefix: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(writes_table).where(writes_table.c.thread_id.startswith(prefix)))
+            conn.execute(delete(checkpoints_table).where(checkpoints_table.c.thread_id.startswith(prefix)))
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """Return the process-wide checkpointer for the configured backend (needs an app context)."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            if CHECKPOINT_BACKEND == "memory":
+                _checkpointer = MemorySaver()
+            elif CHECKPOINT_BACKEND == "database":
+                _checkpointer = SQLCheckpointSaver(current_app.config["SQLALCHEMY_DATABASE_URI"])
+            elif CHECKPOINT_BACKEND == "sqlite":
+                os.makedirs(os.path.dirname(CHECKPOINT_SQLITE_PATH) or ".", exist_ok=True)
+                _checkpointer = SQLCheckpointSaver(
+                    f"sqlite:///{os.path.abspath(CHECKPOINT_SQLITE_PATH)}", create_tables=True
+                )
+            else:
+                raise ValueError(f"Unknown CHECKPOINT_BACKEND: {CHECKPOINT_BACKEND}")
+        return _checkpointer
+
+
+def delete_workspace_checkpoints(workspace_id: int):
+    saver = get_checkpointer()
+    if isinstance(saver, SQLCheckpointSaver):
+        saver.delete_threads_with_prefix(f"workspace-{workspace_id}:")
@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+import importlib.util
+import httpx
+from dotenv import load_dotenv, find_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from agent_learn_api.utils.delegation_utils import budget_handler
+from agent_learn_api.utils.trace_utils import span, tracing_handler
+
+load_dotenv(find_dotenv())
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# Upper bound on concurrent requests to the model provider across the process
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# HTTP/2 needs the optional `h2` package
+LLM_HTTP2 = importlib.util.find_spec("h2") is not None and os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body wrapper that frees the in-flight slot once the body is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """
+    Keep-alive transport shared by every model client. Caps the number of
+    requests in flight and counts waits and new connections.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, **kwargs):
+        super().__init__(**kwargs)
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.new_connections = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            self._slots.acquire()
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - started
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def _make_release(self):
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+        return release
+
+    def _trace(self, previous):
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self.new_connections += 1
+            if previous:
+                previous(event_name, info)
+        return trace
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._acquire()
+        release = self._make_release()
+        request.extensions["trace"] = self._trace(request.extensions.get("trace"))
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def open_connections(self) -> int:
+        pool = getattr(self, "_pool", None)
+        return len(getattr(pool, "connections", []))
+
+    def stats(self) -> dict:
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "http2": LLM_HTTP2,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "open_connections": self.open_connections(),
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "waits": self.waits,
+                "wait_ms": round(self.wait_seconds * 1000, 2),
+            }
+
+
+transport = PooledTransport(
+    http2=LLM_HTTP2,
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    ),
+)
+http_client = httpx.Client(transport=transport, timeout=LLM_TIMEOUT)
+
+class TracedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that records an "embedding" span per call."""
+
+    def embed_documents(self, texts, *args, **kwargs):
+        with span("embedding", "embed_documents", model=self.model, texts=len(texts),
+                  chars=sum(len(t) for t in texts)):
+            return super().embed_documents(texts, *args, **kwargs)
+
+    def embed_query(self, text, *args, **kwargs):
+        with span("embedding", "embed_query", model=self.model, texts=1, chars=len(text)):
+            return super().embed_query(text, *args, **kwargs)
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_chat_model(model: str = "gpt-4o", temperature: float = 0.9, **kwargs) -> ChatOpenAI:
+    """
+    Return the shared ChatOpenAI for these settings, built on the pooled HTTP
+    client. Every call is traced and charged to the current request's budget.
+    Only deterministic (temperature 0) models use the shared LLM cache unless
+    `cache` is passed; sampled answers must not be replayed to the next asker.
+    """
+    kwargs.setdefault("cache", None if temperature == 0 else False)
+    key = ("chat", model, temperature, tuple(sorted(kwargs.items())))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = ChatOpenAI(
+                model=model, temperature=temperature, http_client=http_client,
+                # The budget check goes first so a refused call never opens a span
+                callbacks=[budget_handler, tracing_handler], **kwargs
+            )
+        return _models[key]
+
+
+def get_embeddings(**kwargs) -> OpenAIEmbeddings:
+    """Return the shared OpenAIEmbeddings client (default model unless overridden)."""
+    key = ("embeddings", tuple(sorted(kwargs.items())))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = TracedOpenAIEmbeddings(http_client=http_client, **kwargs)
+        return _models[key]
+
+
+def get_client_stats() -> dict:
+    with _models_lock:
+        clients = len(_models)
+    return {"clients": clients, **transport.stats()}
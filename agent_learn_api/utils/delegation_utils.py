@@ -0,0 +1,142 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+load_dotenv(find_dotenv())
+
+DELEGATION_MAX_DEPTH = int(os.getenv("DELEGATION_MAX_DEPTH", "2"))
+DELEGATION_MAX_LLM_CALLS = int(os.getenv("DELEGATION_MAX_LLM_CALLS", "12"))
+DELEGATION_HISTORY = int(os.getenv("DELEGATION_HISTORY", "50"))
+
+_current_tracker = contextvars.ContextVar("delegation_tracker", default=None)
+_recent = deque(maxlen=DELEGATION_HISTORY)
+_recent_lock = threading.Lock()
+
+
+class DelegationLimitError(Exception):
+    """Raised when a request exceeds its delegation depth or LLM-call budget."""
+
+
+def _normalize(query: str) -> str:
+    return " ".join(str(query).lower().split())
+
+
+class DelegationTracker:
+    """Delegation tree, LLM-call count and sub-call memo for one chat request."""
+
+    def __init__(self, workspace_id: int, user_id: int, query: str,
+                 max_depth: int = DELEGATION_MAX_DEPTH, max_llm_calls: int = DELEGATION_MAX_LLM_CALLS):
+        self.request_id = uuid.uuid4().hex
+        self.workspace_id = workspace_id
+        self.user_id = user_id
+        self.max_depth = max_depth
+        self.max_llm_calls = max_llm_calls
+        self.llm_calls = 0
+        self.memo_hits = 0
+        self.memo = {}
+        self.started_at = time.time()
+        self.root = {"agent": "router", "query": query[:200], "children": []}
+        self._stack = [self.root]
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack) - 1
+
+    def charge_llm_call(self):
+        if self.llm_calls >= self.max_llm_calls:
+            raise DelegationLimitError(f"LLM call budget of {self.max_llm_calls} exhausted")
+        self.llm_calls += 1
+
+    def lookup(self, agent_name: str, query: str):
+        key = (agent_name, _normalize(query))
+        if key not in self.memo:
+            return None
+        self.memo_hits += 1
+        self._stack[-1]["children"].append(
+            {"agent": agent_name, "query": query[:200], "memoized": True, "children": []}
+        )
+        return self.memo[key]
+
+    @contextmanager
+    def delegate(self, agent_name: str, query: str):
+        if self.depth >= self.max_depth:
+            raise DelegationLimitError(f"Maximum delegation depth of {self.max_depth} reached")
+        node = {"agent": agent_name, "query": query[:200], "memoized": False, "children": []}
+        self._stack[-1]["children"].append(node)
+        self._stack.append(node)
+        started = time.perf_counter()
+        try:
+            yield node
+        finally:
+            node["duration_ms"] = int((time.perf_counter() - started) * 1000)
+            self._stack.pop()
+
+    def remember(self, agent_name: str, query: str, result: str):
+        self.memo[(agent_name, _normalize(query))] = result
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "workspace_id": self.workspace_id,
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "llm_calls": self.llm_calls,
+            "memo_hits": self.memo_hits,
+            "max_depth": self.max_depth,
+            "max_llm_calls": self.max_llm_calls,
+            "tree": self.root,
+        }
+
+
+@contextmanager
+def track_request(workspace_id: int, user_id: int, query: str):
+    """Track delegation for one agent run and keep its summary for inspection."""
+    tracker = DelegationTracker(workspace_id, user_id, query)
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+        with _recent_lock:
+            _recent.append(tracker.summary())
+
+
+def current_tracker() -> DelegationTracker | None:
+    return _current_tracker.get()
+
+
+def charge_llm_call():
+    """Count one LLM call against the current request's budget, if any."""
+    tracker = current_tracker()
+    if tracker is not None:
+        tracker.charge_llm_call()
+
+
+class BudgetCallbackHandler(BaseCallbackHandler):
+    """
+    Charges every model call against the current request's budget, so calls
+    made inside tools (answers, quizzes, PDFs, each mind map subtopic) count too.
+    """
+
+    # Let the limit error abort the call instead of being logged and ignored
+    raise_error = True
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        charge_llm_call()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        charge_llm_call()
+
+
+budget_handler = BudgetCallbackHandler()
+
+
+def recent_delegations() -> list:
+    with _recent_lock:
+        return list(_recent)
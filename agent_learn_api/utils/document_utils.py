@@ -5,36 +5,71 @@ from fpdf import FPDF
 from dotenv import load_dotenv, find_dotenv
 from datetime import datetime
 from diffusers import StableDiffusionPipeline
-from langchain_community.vectorstores.faiss import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_community.document_loaders import Docx2txtLoader, TextLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
+from agent_learn_api.utils.blob_utils import get_parsed, remember_parsed
+from agent_learn_api.utils.client_utils import get_chat_model
+from agent_learn_api.utils.embedding_cache_utils import get_cached_embeddings
+from agent_learn_api.utils.image_utils import (
+    LOCAL_OCR_ENGINE, OCR_BACKEND, get_cached_ocr, image_sha, local_ocr, needs_escalation, ocr_timer, prepare_image,
+    put_cached_ocr,
+)
+from agent_learn_api.utils.pdf_utils import iter_pdf_pages
+from agent_learn_api.utils.index_utils import WorkspaceRetriever, append_segment, index_version
 
 load_dotenv(find_dotenv())
 
-INDEX_DIR = "indexes"
-embeddings = OpenAIEmbeddings()
-vision_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "500"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+embeddings = get_cached_embeddings()
+VISION_MODEL = "gpt-4o-mini"
+vision_llm = get_chat_model(VISION_MODEL, temperature=0)
 
 
 def ocr_image(file_path: str) -> str:
+    """
+    Extract text from an image, cached by content. A local OCR engine reads
+    it first when installed; unsure or sparse results (handwriting, diagrams)
+    go to the vision model.
+    """
+    sha = image_sha(file_path)
+    engines = (VISION_MODEL,) if OCR_BACKEND == "vision" else (VISION_MODEL, LOCAL_OCR_ENGINE)
+    cached = get_cached_ocr(sha, *engines)
+    if cached is not None:
+        return cached
+
+    result = local_ocr(file_path)
+    if result is not None:
+        text, confidence, words = result
+        if not needs_escalation(confidence, words):
+            put_cached_ocr(sha, LOCAL_OCR_ENGINE, text)
+            return text
+
+    text = vision_ocr(file_path)
+    put_cached_ocr(sha, VISION_MODEL, text)
+    return text
+
+
+def vision_ocr(file_path: str) -> str:
     """Extract text + description from an image using GPT-4o Vision."""
-    with open(file_path, "rb") as f:
-        b64_img = base64.b64encode(f.read()).decode("utf-8")
-
-    response = vision_llm.invoke([
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Extract visible text and summarize notes/diagrams."},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{b64_img}"}
-                }
-            ]
-        }
-    ])
+    data, mime = prepare_image(file_path)
+    b64_img = base64.b64encode(data).decode("utf-8")
+
+    with ocr_timer("vision"):
+        response = vision_llm.invoke([
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Extract visible text and summarize notes/diagrams."},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mime};base64,{b64_img}"}
+                    }
+                ]
+            }
+        ])
     return response.content
 
 def load_pipe():
@@ -93,64 +128,85 @@ def generate_pdf(topic: str, workspace_id: int):
 
             
 
-def load_document(file_path: str) -> list[Document]:
-    """Load a text-based document into LangChain format."""
+def document_loader(file_path: str):
     if file_path.endswith(".txt"):
-        loader = TextLoader(file_path, encoding="utf-8")
+        return TextLoader(file_path, encoding="utf-8")
     elif file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
+        return PyPDFLoader(file_path)
     elif file_path.endswith(".docx") or file_path.endswith(".doc"):
-        loader = Docx2txtLoader(file_path)
+        return Docx2txtLoader(file_path)
+    raise ValueError(f"Unsupported text file type: {file_path}")
+
+
+def iter_pages(file_path: str):
+    """Yield a text-based document one page (or file) at a time."""
+    if file_path.endswith(".pdf"):
+        # Large PDFs are extracted in parallel page ranges
+        yield from iter_pdf_pages(file_path)
     else:
-        raise ValueError(f"Unsupported text file type: {file_path}")
-    return loader.load()
+        yield from document_loader(file_path).lazy_load()
 
 
-def build_faiss_index(docs: list[Document]) -> FAISS:
-    return FAISS.from_documents(docs, embeddings)
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    try:
+        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base", chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS
+        )
+    except ImportError:
+        # Roughly four characters per token without tiktoken
+        return RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_TOKENS * 4, chunk_overlap=CHUNK_OVERLAP_TOKENS * 4
+        )
 
 
-def save_faiss_index(faiss_index: FAISS, workspace_id: int):
-    path = os.path.join(INDEX_DIR, str(workspace_id))
-    os.makedirs(path, exist_ok=True)
-    faiss_index.save_local(path)
+splitter = _make_splitter()
 
 
-def load_faiss_index(workspace_id: int) -> FAISS | None:
-    path = os.path.join(INDEX_DIR, str(workspace_id))
-    if not os.path.exists(path):
-        return None
-    return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+def iter_chunks(pages):
+    """Split pages into token-sized, overlapping chunks as they arrive."""
+    for page in pages:
+        yield from splitter.split_documents([page])
 
 
-def add_to_index(file_path: str, workspace_id: int, extra_text: str | None = None):
+def add_to_index(file_path: str, workspace_id: int, extra_text: str | None = None, on_stage=None,
+                 document_id: int | None = None, blob_sha: str | None = None):
     """
-    Load a document or image and add it to the FAISS index.
+    Load a document or image and add it to the workspace index.
+    `on_stage(stage, **detail)` is called as parse, chunk, embed and index start.
+    Chunks are tagged with `document_id` so they can be deleted with the document.
+    Uploads with a `blob_sha` reuse the chunks of earlier uploads of the same bytes.
+
+    Pages are read, split and embedded as a stream, so memory does not grow
+    with the size of the file.
     """
-    docs = []
+    notify = on_stage or (lambda stage, **detail: None)
     ext = os.path.splitext(file_path)[1].lower()
 
-    if ext in [".txt", ".pdf", ".docx", ".doc"]:
-        docs = load_document(file_path)
+    notify("parse")
+    cached = None if extra_text else get_parsed(blob_sha)
+    if cached is not None:
+        chunks = iter(cached)
+    elif ext in [".txt", ".pdf", ".docx", ".doc"]:
+        chunks = remember_parsed(blob_sha, iter_chunks(iter_pages(file_path)))
     elif ext in [".png", ".jpg", ".jpeg"]:
+        text = extra_text or ocr_image(file_path)
+        chunks = iter_chunks([Document(page_content=text, metadata={"source": file_path})])
         if not extra_text:
-            extra_text = ocr_image(file_path)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        docs = splitter.create_documents([extra_text], metadatas=[{"source": file_path}])
+            chunks = remember_parsed(blob_sha, chunks)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
+    notify("chunk", reused=cached is not None)
 
-    index = load_faiss_index(workspace_id)
-    if index:
-        index.add_documents(docs)
-    else:
-        index = build_faiss_index(docs)
+    def tagged():
+        # Copies, so chunks kept for the parse cache stay free of document ids
+        for chunk in chunks:
+            yield Document(page_content=chunk.page_content, metadata={**chunk.metadata, "document_id": document_id})
 
-    save_faiss_index(index, workspace_id)
+    # Each upload becomes its own segment; existing segments are never rewritten
+    append_segment(workspace_id, tagged(), on_stage=notify)
 
 
 def get_retriever(workspace_id: int):
-    index = load_faiss_index(workspace_id)
-    if not index:
+    if index_version(workspace_id) is None:
         return None
-    return index.as_retriever(search_kwargs={"k": 5})
+    return WorkspaceRetriever(workspace_id=workspace_id, k=5)
@@ -0,0 +1,225 @@
+import os
+import re
+import math
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.embeddings import Embeddings
+from agent_learn_api.utils.client_utils import get_embeddings
+
+load_dotenv(find_dotenv())
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(CACHE_DIR, "embeddings"))
+# SQLite IN (...) lists are kept below the default host-parameter limit
+_LOOKUP_BATCH = 500
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent vectors keyed by (model, sha256 of text). Each model's vectors
+    live in one append-only float32 file read through a memory map; a SQLite
+    table maps each key to its row in that file. Writers hold a SQLite write
+    lock from picking their rows until they are published, so processes
+    sharing the directory never write over each other's rows.
+    """
+
+    def __init__(self, root: str = EMBEDDING_CACHE_DIR):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self._lock = threading.Lock()
+        self._maps = {}  # model -> np.memmap
+        self._conn = sqlite3.connect(
+            os.path.join(root, "keys.sqlite"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_keys ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, row INTEGER NOT NULL, dim INTEGER NOT NULL, "
+            "PRIMARY KEY (model, key))"
+        )
+
+    @contextmanager
+    def _transaction(self, mode: str = ""):
+        """Explicit transaction; "IMMEDIATE" takes the database write lock up front."""
+        self._conn.execute(f"BEGIN {mode}")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _vectors_path(self, model: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]", "_", model) + ".f32")
+
+    def _meta(self, model: str):
+        """(rows, dim) currently published for `model`."""
+        row = self._conn.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0), MAX(dim) FROM embedding_keys WHERE model = ?", (model,)
+        ).fetchone()
+        return row[0], row[1]
+
+    def _matrix(self, model: str, rows: int, dim: int):
+        mapped = self._maps.get(model)
+        if mapped is None or mapped.shape[0] < rows:
+            mapped = np.memmap(self._vectors_path(model), dtype=np.float32, mode="r", shape=(rows, dim))
+            self._maps[model] = mapped
+        return mapped
+
+    def get_many(self, model: str, keys: list[str]) -> dict:
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        # One read transaction, so no key points past the rows it was sized for
+        with self._lock, self._transaction():
+            rows, dim = self._meta(model)
+            if not rows:
+                return found
+            matrix = self._matrix(model, rows, dim)
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for key, row in self._conn.execute(
+                    f"SELECT key, row FROM embedding_keys WHERE model = ? AND key IN ({placeholders})",
+                    (model, *batch),
+                ):
+                    found[key] = matrix[row].tolist()
+        return found
+
+    def put_many(self, model: str, items: dict):
+        """Append {key: vector} to the model's file, then publish the rows."""
+        if not items:
+            return
+        # The write lock is held from reading the row count until the rows are
+        # published, so another process cannot pick the same rows meanwhile
+        with self._lock, self._transaction("IMMEDIATE"):
+            rows, dim = self._meta(model)
+            keys = list(items)
+            vectors = np.asarray([items[k] for k in keys], dtype=np.float32)
+            if dim is not None and vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension changed for {model}: {dim} -> {vectors.shape[1]}")
+
+            # Write at the published end, overwriting anything left by an unfinished write
+            path = self._vectors_path(model)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(rows * vectors.shape[1] * 4)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_keys (model, key, row, dim) VALUES (?, ?, ?, ?)",
+                [(model, key, rows + i, vectors.shape[1]) for i, key in enumerate(keys)],
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embedding_keys").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends chunks with unseen text to the API.
+    Query embeddings are passed straight through.
+    """
+
+    def __init__(self, inner, store: EmbeddingStore):
+        self.inner = inner
+        self.store = store
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.saved_calls = 0
+
+    def _api_calls(self, n: int) -> int:
+        return math.ceil(n / (getattr(self.inner, "chunk_size", 1000) or 1000)) if n else 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [text_key(t) for t in texts]
+        vectors = self.store.get_many(self.model, keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            fresh = self.inner.embed_documents(list(missing.values()))
+            new = dict(zip(missing, fresh))
+            self.store.put_many(self.model, new)
+            vectors.update(new)
+
+        hits = len(texts) - len(missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(missing)
+            self.saved_tokens += sum(count_tokens(t) for k, t in zip(keys, texts) if k not in missing)
+            self.saved_calls += self._api_calls(len(texts)) - self._api_calls(len(missing))
+        if hits and len(texts) > 1:
+            print(f"♻️ Embedding cache: {hits}/{len(texts)} chunks reused, {len(missing)} sent to {self.model}")
+        return [vectors[k] for k in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.inner.embed_query(text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_api_calls": self.saved_calls,
+                "saved_tokens": self.saved_tokens,
+                "stored_vectors": self.store.count(),
+            }
+
+
+_store = None
+_cached = {}
+_cached_lock = threading.Lock()
+
+
+def get_cached_embeddings(**kwargs):
+    """Shared embeddings client for ingestion, backed by the on-disk cache when enabled."""
+    global _store
+    inner = get_embeddings(**kwargs)
+    if not EMBEDDING_CACHE_ENABLED:
+        return inner
+    key = tuple(sorted(kwargs.items()))
+    with _cached_lock:
+        if key not in _cached:
+            _store = _store or EmbeddingStore()
+            _cached[key] = CachedEmbeddings(inner, _store)
+        return _cached[key]
+
+
+def get_embedding_cache_stats() -> dict:
+    with _cached_lock:
+        clients = list(_cached.values())
+    if not clients:
+        return {"enabled": EMBEDDING_CACHE_ENABLED}
+    return {"enabled": True, "clients": [c.stats() for c in clients]}
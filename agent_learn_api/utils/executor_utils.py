@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+AGENT_EXECUTOR = os.getenv("AGENT_EXECUTOR", "thread")  # "thread" or "process"
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "32"))
+
+
+class ExecutorBusyError(Exception):
+    """Raised when the executor already holds its maximum number of runs."""
+
+
+def _init_process_worker():
+    # Each worker process gets its own app so run_agent can reach the database
+    from agent_learn_api import create_app
+    app = create_app()
+    app.app_context().push()
+
+
+def _run_in_app(app, fn, args):
+    with app.app_context():
+        return fn(*args)
+
+
+class WorkspaceExecutor:
+    """
+    Bounded executor for agent runs.
+    Runs for the same workspace execute one at a time in submission order;
+    different workspaces run in parallel up to the worker count.
+    """
+
+    def __init__(self, kind: str = AGENT_EXECUTOR, workers: int = AGENT_WORKERS,
+                 max_pending: int = AGENT_QUEUE_SIZE, name: str = "agent-run"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+        self._pool = None
+        self._queues = {}  # workspace_id -> deque of (fn, args, app, future)
+        self._pending = 0
+        # Re-entrant: a run that finishes before its callback is attached calls back under the lock
+        self._lock = threading.RLock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def supports_streaming(self) -> bool:
+        # Chunk callbacks cannot cross a process boundary
+        return self.kind == "thread"
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_init_process_worker)
+            else:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+        return self._pool
+
+    def submit(self, workspace_id, fn, *args, app=None) -> Future:
+        """
+        Queue `fn(*args)` behind earlier runs of the same workspace.
+        In thread mode `app` is pushed as the app context for the run.
+        Raises ExecutorBusyError when the queue is full.
+        """
+        future = Future()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusyError(f"{self.name} queue is full ({self.max_pending} runs pending)")
+            self._pending += 1
+            self.submitted += 1
+            queue = self._queues.get(workspace_id)
+            if queue is None:
+                self._queues[workspace_id] = deque([(fn, args, app, future)])
+                self._dispatch(workspace_id)
+            else:
+                queue.append((fn, args, app, future))
+        return future
+
+    def _dispatch(self, workspace_id):
+        # Caller holds the lock; the head of the queue is the run to start
+        fn, args, app, future = self._queues[workspace_id][0]
+        if app is not None and self.kind == "thread":
+            inner = self._get_pool().submit(_run_in_app, app, fn, args)
+        else:
+            inner = self._get_pool().submit(fn, *args)
+        inner.add_done_callback(lambda done: self._finish(workspace_id, future, done))
+
+    def _finish(self, workspace_id, future: Future, done: Future):
+        error = done.exception()
+        with self._lock:
+            self._pending -= 1
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            queue = self._queues[workspace_id]
+            queue.popleft()
+            if queue:
+                self._dispatch(workspace_id)
+            else:
+                del self._queues[workspace_id]
+
+        if error:
+            future.set_exception(error)
+        else:
+            future.set_result(done.result())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "active_workspaces": len(self._queues),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+agent_executor = WorkspaceExecutor()
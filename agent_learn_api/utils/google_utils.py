@@ -2,14 +2,14 @@ import os
 import openai
 import requests
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
+from agent_learn_api.utils.client_utils import get_chat_model
 
 load_dotenv(find_dotenv())
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 SEARCH_URL = "https://google.serper.dev/search"
-model = ChatOpenAI(model="gpt-4o", temperature=0.9)
+model = get_chat_model("gpt-4o", temperature=0.9)
 
 def google_search(query: str):
     """
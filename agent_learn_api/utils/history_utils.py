@@ -0,0 +1,150 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from flask import current_app
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from agent_learn_api import db
+from agent_learn_api.models.chat import Chat
+from agent_learn_api.models.chat_summary import ChatSummary
+from agent_learn_api.utils.client_utils import get_chat_model
+
+load_dotenv(find_dotenv())
+
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "20"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+# Refresh the summary once this many tokens have scrolled out of the window unsummarized
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "1500"))
+# Cap on messages folded into the summary per refresh
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", "200"))
+
+summary_model = get_chat_model("gpt-4o-mini", temperature=0)
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4o")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _to_message(chat: Chat):
+    if chat.role == "user":
+        return HumanMessage(content=chat.content)
+    return AIMessage(content=chat.content)
+
+
+def load_history_window(user_id: int, workspace_id: int) -> list:
+    """
+    Return the rolling summary plus the most recent messages, newest last,
+    trimmed so the whole history fits in HISTORY_TOKEN_BUDGET tokens.
+    """
+    summary = ChatSummary.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
+    rows = (
+        Chat.query.filter_by(user_id=user_id, workspace_id=workspace_id)
+        .order_by(Chat.id.desc())
+        .limit(HISTORY_WINDOW)
+        .all()
+    )
+
+    history = []
+    budget = HISTORY_TOKEN_BUDGET
+    if summary and summary.content:
+        summary_msg = SystemMessage(content=f"Summary of the earlier conversation:\n{summary.content}")
+        budget -= count_tokens(summary_msg.content)
+        if budget > 0:
+            history.append(summary_msg)
+
+    # Walk from the newest message back until the budget is spent
+    kept = []
+    window_start_id = rows[0].id + 1 if rows else None
+    for chat in rows:
+        cost = count_tokens(chat.content)
+        if cost > budget:
+            break
+        budget -= cost
+        kept.append(_to_message(chat))
+        window_start_id = chat.id
+    history.extend(reversed(kept))
+
+    # Everything older than the oldest message shown, including messages of the
+    # window that did not fit the budget, is left to the summary
+    if rows:
+        maybe_refresh_summary(user_id, workspace_id, window_start_id=window_start_id, summary=summary)
+    return history
+
+
+def _unsummarized_query(user_id: int, workspace_id: int, after_id: int, before_id: int):
+    return Chat.query.filter(
+        Chat.user_id == user_id,
+        Chat.workspace_id == workspace_id,
+        Chat.id > after_id,
+        Chat.id < before_id,
+    )
+
+
+def maybe_refresh_summary(user_id: int, workspace_id: int, window_start_id: int, summary=None):
+    """Schedule a background refresh when enough history has left the window."""
+    last_id = summary.last_chat_id if summary else 0
+    chars = (
+        _unsummarized_query(user_id, workspace_id, last_id, window_start_id)
+        .with_entities(db.func.sum(db.func.length(Chat.content)))
+        .scalar()
+    ) or 0
+    # Character count / 4 is close enough to decide whether a refresh is due
+    if chars // 4 < SUMMARY_TRIGGER_TOKENS:
+        return
+
+    key = (workspace_id, user_id)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    app = current_app._get_current_object()
+    _summary_executor.submit(_refresh_summary, app, user_id, workspace_id, window_start_id)
+
+
+def _refresh_summary(app, user_id: int, workspace_id: int, window_start_id: int):
+    try:
+        with app.app_context():
+            summary = ChatSummary.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
+            if summary is None:
+                summary = ChatSummary(workspace_id=workspace_id, user_id=user_id, content="", last_chat_id=0)
+                db.session.add(summary)
+
+            rows = (
+                _unsummarized_query(user_id, workspace_id, summary.last_chat_id, window_start_id)
+                .order_by(Chat.id.asc())
+                .limit(SUMMARY_MAX_MESSAGES)
+                .all()
+            )
+            if not rows:
+                return
+
+            transcript = "\n".join(f"{c.role}: {c.content}" for c in rows)
+            prompt = (
+                "You maintain a running summary of a study conversation between a student "
+                "and an assistant. Update the summary with the new messages, keeping topics, "
+                "facts the student provided and open questions. Reply with the summary only.\n\n"
+                f"Current summary:\n{summary.content or '(empty)'}\n\n"
+                f"New messages:\n{transcript}"
+            )
+            summary.content = summary_model.invoke(prompt).content
+            summary.last_chat_id = rows[-1].id
+            db.session.commit()
+    except Exception as e:
+        print("❌ Chat summary refresh failed:", e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard((workspace_id, user_id))
@@ -0,0 +1,209 @@
+import io
+import os
+import hashlib
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv, find_dotenv
+from PIL import Image, ImageOps
+from agent_learn_api.utils.cache_utils import SqliteStore
+from agent_learn_api.utils.trace_utils import percentile, span
+
+load_dotenv(find_dotenv())
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Images sent to the vision model are downscaled so their longest edge fits this
+OCR_MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "1600"))
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "JPEG").upper()  # "JPEG" or "WEBP"
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "85"))
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(CACHE_DIR, "ocr.sqlite"))
+
+# "auto" tries the local engine first and escalates to the vision model,
+# "local" never escalates, "vision" always uses the vision model
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+OCR_BACKENDS = ("auto", "local", "vision")
+if OCR_BACKEND not in OCR_BACKENDS:
+    raise ValueError(f"Unknown OCR_BACKEND: {OCR_BACKEND}")
+LOCAL_OCR_ENGINE = "tesseract"
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Local results below either threshold (handwriting, diagrams, photos) go to the vision model
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "80"))
+OCR_MIN_WORDS = int(os.getenv("OCR_MIN_WORDS", "20"))
+# Latency samples kept per backend
+OCR_LATENCY_WINDOW = 1000
+
+_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+_READ_SIZE = 1 << 20
+
+ocr_store = None
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "bytes_in": 0, "bytes_sent": 0, "local_runs": 0, "escalations": 0}
+_latency = {}  # backend -> deque of ms
+_local_available = pytesseract is not None
+
+
+def image_sha(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prepare_image(file_path: str) -> tuple:
+    """
+    Downscale to OCR_MAX_EDGE, apply the EXIF rotation and re-encode without
+    metadata. Returns (bytes, mime type); the original file is kept if
+    re-encoding would not make it smaller.
+    """
+    original_size = os.path.getsize(file_path)
+    with Image.open(file_path) as img:
+        original_format = img.format
+        resized = max(img.size) > OCR_MAX_EDGE
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha; flatten transparent screenshots onto white
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((OCR_MAX_EDGE, OCR_MAX_EDGE), Image.Resampling.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format=OCR_IMAGE_FORMAT, quality=OCR_IMAGE_QUALITY, optimize=True)
+        data = out.getvalue()
+
+    if not resized and len(data) >= original_size and original_format in _MIME:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        mime = _MIME[original_format]
+    else:
+        mime = _MIME.get(OCR_IMAGE_FORMAT, "image/jpeg")
+    with _lock:
+        _counters["bytes_in"] += original_size
+        _counters["bytes_sent"] += len(data)
+    return data, mime
+
+
+# --- OCR results by image content ---
+def _store() -> SqliteStore:
+    global ocr_store
+    with _lock:
+        if ocr_store is None:
+            ocr_store = SqliteStore(OCR_CACHE_PATH, table="ocr_results")
+        return ocr_store
+
+
+def get_cached_ocr(sha: str, *models: str) -> str | None:
+    """Cached OCR text for the image from the first of `models` that has it."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    text = None
+    for model in models:
+        text = _store().get(f"{model}:{sha}")
+        if text is not None:
+            break
+    with _lock:
+        _counters["hits" if text is not None else "misses"] += 1
+    return text
+
+
+def put_cached_ocr(sha: str, model: str, text: str):
+    if OCR_CACHE_ENABLED and text:
+        _store().set(f"{model}:{sha}", text)
+
+
+# --- OCR backends ---
+@contextmanager
+def ocr_timer(backend: str):
+    """Record one OCR call's latency for `backend`, and trace it as an "ocr" span."""
+    started = time.perf_counter()
+    with span("ocr", backend):
+        yield
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _lock:
+        _latency.setdefault(backend, deque(maxlen=OCR_LATENCY_WINDOW)).append(elapsed_ms)
+
+
+def local_ocr_available() -> bool:
+    return _local_available and OCR_BACKEND != "vision"
+
+
+def local_ocr(file_path: str) -> tuple | None:
+    """
+    Read an image with Tesseract. Returns (text, mean word confidence, words),
+    or None when no local engine is installed.
+    """
+    global _local_available
+    if not local_ocr_available():
+        return None
+    try:
+        with ocr_timer(LOCAL_OCR_ENGINE), Image.open(file_path) as img:
+            img = ImageOps.exif_transpose(img).convert("L")
+            data = pytesseract.image_to_data(img, lang=OCR_LANG, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractNotFoundError:
+        print("❌ pytesseract is installed but the tesseract binary was not found; using the vision model")
+        _local_available = False
+        return None
+
+    lines, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confidences.append(conf)
+
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    with _lock:
+        _counters["local_runs"] += 1
+    return text, confidence, len(confidences)
+
+
+def needs_escalation(confidence: float, words: int) -> bool:
+    """Whether a local OCR result is too unsure or too sparse to index as is."""
+    if OCR_BACKEND == "local":
+        return False
+    escalate = confidence < OCR_MIN_CONFIDENCE or words < OCR_MIN_WORDS
+    if escalate:
+        with _lock:
+            _counters["escalations"] += 1
+    return escalate
+
+
+def get_ocr_stats() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        latency = {
+            backend: {
+                "calls": len(samples),
+                "p50_ms": round(percentile(list(samples), 50), 2),
+                "p95_ms": round(percentile(list(samples), 95), 2),
+            }
+            for backend, samples in _latency.items()
+        }
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": OCR_CACHE_ENABLED,
+        "backend": OCR_BACKEND,
+        "local_engine": LOCAL_OCR_ENGINE if _local_available else None,
+        "max_edge": OCR_MAX_EDGE,
+        "format": OCR_IMAGE_FORMAT,
+        **counters,
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        "escalation_rate": round(counters["escalations"] / counters["local_runs"], 4) if counters["local_runs"] else 0.0,
+        "bytes_saved": counters["bytes_in"] - counters["bytes_sent"],
+        "latency": latency,
+    }
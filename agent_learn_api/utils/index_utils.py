@@ -0,0 +1,917 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+import itertools
+from contextlib import contextmanager
+import faiss
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+from agent_learn_api.models.document import Document as DocumentRow
+from agent_learn_api.utils.cache_utils import LRUCache
+from agent_learn_api.utils.embedding_cache_utils import get_cached_embeddings, text_key
+from agent_learn_api.utils.pack_utils import PackStore
+from agent_learn_api.utils.segment_utils import (
+    INDEX_ANN_KIND, INDEX_ANN_THRESHOLD, INDEX_CODEC, INDEX_KINDS, LEGACY_FILES,
+    SegmentWriter, choose_index_kind, is_legacy, new_index, open_segment, write_segment_files,
+)
+from agent_learn_api.utils.trace_utils import percentile, span
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are only serialized within a process
+    fcntl = None
+
+load_dotenv(find_dotenv())
+
+INDEX_DIR = "indexes"
+MANIFEST_NAME = "manifest.json"
+SEGMENTS_DIR = "segments"
+# A workspace that predates segments keeps index.faiss/index.pkl in its root
+LEGACY_SEGMENT = "."
+
+# Loaded segments are kept in memory up to this many (estimated) bytes
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Merge a workspace's segments once it has this many...
+INDEX_COMPACT_SEGMENTS = int(os.getenv("INDEX_COMPACT_SEGMENTS", "8"))
+# ...or once the segments added since the base segment reach this size on disk
+INDEX_COMPACT_BYTES = int(os.getenv("INDEX_COMPACT_BYTES", str(64 * 1024 * 1024)))
+# ...or once this share of its vectors belongs to deleted documents
+INDEX_COMPACT_DELETED_RATIO = float(os.getenv("INDEX_COMPACT_DELETED_RATIO", "0.2"))
+# Quantized segments return this many times k candidates, re-scored with exact vectors
+INDEX_RERANK = os.getenv("INDEX_RERANK", "true").lower() in ("1", "true", "yes")
+INDEX_RERANK_FACTOR = int(os.getenv("INDEX_RERANK_FACTOR", "4"))
+# Repeated questions skip the query embedding call and, until the index changes, the search
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", str(24 * 3600)))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+# Chunks per embedding request while streaming a document into a segment
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Opt-in: workspaces below INDEX_PACK_MAX_VECTORS share pack shard files instead
+# of a directory each, and are promoted to their own segments once they outgrow it
+INDEX_PACKED = os.getenv("INDEX_PACKED", "false").lower() in ("1", "true", "yes")
+INDEX_PACK_MAX_VECTORS = int(os.getenv("INDEX_PACK_MAX_VECTORS", "2000"))
+PACK_DIR = os.path.join(INDEX_DIR, "packed")
+# Kept outside the workspace directories, which are removed while their lock is held
+LOCK_DIR = os.path.join(INDEX_DIR, ".locks")
+
+embeddings = get_cached_embeddings()
+
+# (workspace_id, segment) -> Segment; dropped segments close their file handles
+segment_cache = LRUCache(max_bytes=INDEX_CACHE_MAX_BYTES, on_evict=lambda key, segment: segment.close())
+_segment_loads = {}  # workspace_id -> {"loads": n, "last_load_ms": ms}
+query_cache = LRUCache(max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)  # (ws, query) -> vector
+result_cache = LRUCache(max_entries=RESULT_CACHE_SIZE)  # (ws, version, query, k) -> [(Document, score)]
+_compactions = {"runs": 0, "merged_segments": 0, "failures": 0, "last_ms": 0.0}
+pack_store = PackStore(PACK_DIR)
+_promotions = {"promoted": 0, "packed": 0}
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-compactor")
+_compacting = set()
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def workspace_lock(workspace_id: int):
+    """
+    Serializes manifest updates for one workspace, across threads and across
+    processes (CLI commands, other server workers) through a file lock.
+    """
+    with _locks_guard:
+        lock = _locks.setdefault(workspace_id, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        with open(os.path.join(LOCK_DIR, f"{workspace_id}.lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# --- Paths and manifest ---
+def workspace_dir(workspace_id: int) -> str:
+    return os.path.join(INDEX_DIR, str(workspace_id))
+
+
+def segment_path(workspace_id: int, name: str) -> str:
+    if name == LEGACY_SEGMENT:
+        return workspace_dir(workspace_id)
+    return os.path.join(workspace_dir(workspace_id), SEGMENTS_DIR, name)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, f))
+        for f in os.listdir(path)
+        if os.path.isfile(os.path.join(path, f))
+    )
+
+
+def read_manifest(workspace_id: int) -> dict | None:
+    """Current manifest, a synthesized one for a legacy index, or None when there is no index."""
+    path = workspace_dir(workspace_id)
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+
+    if not is_legacy(path):
+        return None
+    return {
+        "version": 0,
+        "segments": [{"name": LEGACY_SEGMENT, "vectors": None, "bytes": _dir_bytes(path)}],
+    }
+
+
+def write_manifest(workspace_id: int, manifest: dict):
+    """Replace the manifest atomically; readers see either the old or the new file."""
+    path = workspace_dir(workspace_id)
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, f".{MANIFEST_NAME}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, MANIFEST_NAME))
+    # Results are keyed by version already; this just frees the stale entries early
+    result_cache.invalidate(lambda key: key[0] == workspace_id)
+
+
+def tombstones(manifest: dict) -> tuple:
+    """(document ids, source paths) whose chunks are deleted but not yet compacted away."""
+    stones = manifest.get("tombstones") or {}
+    return tuple(sorted(stones.get("documents", []))), tuple(sorted(stones.get("sources", [])))
+
+
+def index_version(workspace_id: int):
+    manifest = read_manifest(workspace_id)
+    if manifest:
+        return manifest["version"]
+    packed = packed_info(workspace_id)
+    return packed["version"] if packed else None
+
+
+def packed_info(workspace_id: int) -> dict | None:
+    """{"version", "vectors"} of a workspace held in a pack shard, else None."""
+    shard = pack_store.shard(workspace_id, create=False)
+    return shard.workspace(workspace_id) if shard else None
+
+
+# --- Segments ---
+def write_segment(workspace_id: int, vectors, docs: list[Document], kind: str = "flat",
+                  codec: str = INDEX_CODEC) -> dict:
+    """Write docs and their vectors as a new immutable segment directory and describe it."""
+    name, tmp = _new_segment_dir(workspace_id)
+    codec = write_segment_files(tmp, vectors, docs, kind, codec)
+    return _publish_segment_dir(workspace_id, name, tmp, len(docs), kind, codec)
+
+
+def _new_segment_dir(workspace_id: int) -> tuple:
+    """(name, temporary path) for a segment about to be written."""
+    name = f"seg-{time.time_ns()}-{uuid.uuid4().hex[:6]}"
+    root = os.path.join(workspace_dir(workspace_id), SEGMENTS_DIR)
+    os.makedirs(root, exist_ok=True)
+    # Write next to the final location, then rename so a crash never leaves a half segment
+    return name, os.path.join(root, f".tmp-{name}")
+
+
+def _publish_segment_dir(workspace_id: int, name: str, tmp: str, vectors: int, kind: str, codec: str) -> dict:
+    path = segment_path(workspace_id, name)
+    os.replace(tmp, path)
+    return {
+        "name": name,
+        "kind": kind,
+        "codec": codec,
+        "vectors": vectors,
+        "bytes": _dir_bytes(path),
+        "created_at": time.time(),
+    }
+
+
+def load_segment(workspace_id: int, name: str):
+    """Segments never change once written, so a cached copy is always current."""
+    key = (workspace_id, name)
+    segment = segment_cache.get(key)
+    if segment is not None:
+        return segment
+
+    started = time.perf_counter()
+    segment = open_segment(segment_path(workspace_id, name), embeddings)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    loads = _segment_loads.setdefault(workspace_id, {"loads": 0, "last_load_ms": 0.0})
+    loads["loads"] += 1
+    loads["last_load_ms"] = elapsed_ms
+    segment_cache.put(key, segment, size=segment.resident_bytes)
+    return segment
+
+
+def append_segment(workspace_id: int, docs, on_stage=None):
+    """
+    Embed `docs` into a new segment and publish it in the workspace manifest.
+    `docs` may be any iterable; it is consumed in EMBED_BATCH_SIZE batches so
+    only one batch of chunks is held at a time. `on_stage(stage, **detail)`
+    is told as batches are embedded and when indexing starts.
+
+    With INDEX_PACKED, chunks of a small workspace go to its pack shard
+    instead; one that outgrows INDEX_PACK_MAX_VECTORS gets its own segments.
+    """
+    notify = on_stage or (lambda stage, **detail: None)
+    packed = _packed_vectors(workspace_id)
+    held = []  # (doc, vector) bound for the pack shard, at most INDEX_PACK_MAX_VECTORS
+    writer = None
+    try:
+        for batch in itertools.batched(docs, EMBED_BATCH_SIZE):
+            vectors = embeddings.embed_documents([d.page_content for d in batch])
+            if writer is None and packed is not None and packed + len(held) + len(batch) <= INDEX_PACK_MAX_VECTORS:
+                held.extend(zip(batch, vectors))
+                notify("embed", chunks=len(held))
+                continue
+            if writer is None:
+                name, tmp = _new_segment_dir(workspace_id)
+                writer = SegmentWriter(tmp)
+                if held:
+                    writer.add([d for d, _ in held], [v for _, v in held])
+                    held = []
+            writer.add(list(batch), vectors)
+            notify("embed", chunks=writer.count)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if writer is None:
+        if not held:
+            return
+        notify("index", chunks=len(held))
+        if _pack_chunks(workspace_id, [d for d, _ in held], [v for _, v in held]):
+            return
+        # Another ingest promoted or filled the pack meanwhile; the chunks become a segment
+        name, tmp = _new_segment_dir(workspace_id)
+        writer = SegmentWriter(tmp)
+        writer.add([d for d, _ in held], [v for _, v in held])
+    else:
+        notify("index", chunks=writer.count)
+    codec = writer.finish("flat", INDEX_CODEC)
+    segment = _publish_segment_dir(workspace_id, name, tmp, writer.count, "flat", codec)
+
+    document_ids = writer.document_ids
+    with workspace_lock(workspace_id):
+        manifest = read_manifest(workspace_id) or _promote_packed(workspace_id)
+        promoted = manifest.pop("promoted", False)
+        # Packed deletes leave no tombstones, so a fresh manifest asks the database
+        deleted = _deleted_documents(document_ids) if promoted else set(tombstones(manifest)[0])
+        if None not in document_ids and document_ids <= deleted:
+            # The document was deleted while it was being indexed; a workspace
+            # being promoted stays packed, so its new base segment goes too
+            for s in [segment, *(manifest["segments"] if promoted else [])]:
+                shutil.rmtree(segment_path(workspace_id, s["name"]), ignore_errors=True)
+            return
+        manifest["segments"].append(segment)
+        manifest["version"] += 1
+        write_manifest(workspace_id, manifest)
+        if promoted:
+            pack_store.shard(workspace_id).drop(workspace_id)
+
+    maybe_compact(workspace_id, manifest)
+
+
+# --- Packed small workspaces ---
+def _packed_vectors(workspace_id: int) -> int | None:
+    """Chunks the workspace holds in its pack shard, or None if new chunks belong in segments."""
+    if not INDEX_PACKED or read_manifest(workspace_id) is not None:
+        return None
+    packed = packed_info(workspace_id)
+    return packed["vectors"] if packed else 0
+
+
+def _deleted_documents(document_ids: set) -> set:
+    """The ids among `document_ids` whose Document row no longer exists."""
+    ids = {i for i in document_ids if i is not None}
+    if not ids:
+        return set()
+    live = {row.id for row in DocumentRow.query.with_entities(DocumentRow.id).filter(DocumentRow.id.in_(ids))}
+    return ids - live
+
+
+def _pack_chunks(workspace_id: int, docs: list[Document], vectors) -> bool:
+    """
+    Add chunks to the workspace's pack shard. Returns False, leaving the
+    chunks to the caller, if the workspace got a manifest or would outgrow
+    the pack since the caller decided to pack them.
+    """
+    with workspace_lock(workspace_id):
+        if read_manifest(workspace_id) is not None:
+            return False
+        packed = packed_info(workspace_id)
+        if (packed["vectors"] if packed else 0) + len(docs) > INDEX_PACK_MAX_VECTORS:
+            return False
+        # Chunks of documents deleted while they were being indexed are dropped
+        deleted = _deleted_documents({d.metadata.get("document_id") for d in docs})
+        if deleted:
+            keep = [i for i, d in enumerate(docs) if d.metadata.get("document_id") not in deleted]
+            docs, vectors = [docs[i] for i in keep], [vectors[i] for i in keep]
+        if docs:
+            pack_store.shard(workspace_id).add(workspace_id, docs, vectors)
+    result_cache.invalidate(lambda key: key[0] == workspace_id)
+    return True
+
+
+def _promote_packed(workspace_id: int) -> dict:
+    """
+    Manifest for a workspace getting its first segment: a base segment built
+    from its packed chunks, if it had any. Caller holds the workspace lock and
+    drops the packed copy once the manifest is written.
+    """
+    packed = packed_info(workspace_id)
+    if not packed:
+        return {"version": 0, "segments": []}
+    docs, vectors = pack_store.shard(workspace_id).take(workspace_id)
+    segments = [write_segment(workspace_id, vectors, docs, codec=INDEX_CODEC)] if docs else []
+    _promotions["promoted"] += 1
+    # Versions keep increasing so cached results of the packed copy never match
+    return {"version": packed["version"], "segments": segments, "promoted": True}
+
+
+def exact_vectors(docs: list[Document]) -> dict:
+    """{i: float32 vector} for docs whose text is in the embedding cache."""
+    store = getattr(embeddings, "store", None)
+    if store is None or not docs:
+        return {}
+    keys = [text_key(doc.page_content) for doc in docs]
+    found = store.get_many(embeddings.model, keys)
+    return {i: np.asarray(found[key], dtype=np.float32) for i, key in enumerate(keys) if key in found}
+
+
+# --- Search across segments ---
+class WorkspaceIndex:
+    """Read view over one manifest version: searches every segment and merges the top k."""
+
+    def __init__(self, workspace_id: int, version: int, segments: list, deleted: tuple = ((), ())):
+        self.workspace_id = workspace_id
+        self.version = version
+        self.segments = segments
+        self.deleted = deleted
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s.ntotal for s in self.segments)
+
+    def similarity_search_with_score_by_vector(self, vector: list[float], k: int = 5):
+        query = np.asarray([vector], dtype=np.float32)
+        rerank = INDEX_RERANK and any(s.codec != "none" for s in self.segments)
+        fetch_k = k * INDEX_RERANK_FACTOR if rerank else k
+
+        candidates = []
+        for segment in self.segments:
+            if not segment.ntotal:
+                continue
+            # Tombstoned chunks are skipped inside the FAISS search itself
+            excluded = segment.deleted_positions(*self.deleted)
+            distances, positions = segment.search(query, fetch_k, excluded)
+            candidates.extend(
+                (float(d), segment, int(p)) for d, p in zip(distances[0], positions[0]) if p >= 0
+            )
+        # L2 distances: smaller is closer
+        candidates.sort(key=lambda hit: hit[0])
+        top = candidates[:fetch_k]
+
+        # Only the winning chunks are read from the segment docstores
+        wanted = {}
+        for _, segment, pos in top:
+            wanted.setdefault(id(segment), (segment, []))[1].append(pos)
+        docs = {}
+        for segment, positions in wanted.values():
+            for pos, doc in segment.fetch(positions).items():
+                docs[(id(segment), pos)] = doc
+        hits = [(docs[(id(seg), pos)], score) for score, seg, pos in top if (id(seg), pos) in docs]
+        if rerank:
+            hits = self._rerank(query[0], hits)
+        return hits[:k]
+
+    @staticmethod
+    def _rerank(query: np.ndarray, hits: list) -> list:
+        """Replace quantized distances with exact squared L2 where the vector is cached."""
+        exact = exact_vectors([doc for doc, _ in hits])
+        rescored = [
+            (doc, float(np.sum((exact[i] - query) ** 2)) if i in exact else score)
+            for i, (doc, score) in enumerate(hits)
+        ]
+        rescored.sort(key=lambda hit: hit[1])
+        return rescored
+
+    def similarity_search_with_score(self, query: str, k: int = 5):
+        return self.similarity_search_with_score_by_vector(embeddings.embed_query(query), k=k)
+
+    def similarity_search(self, query: str, k: int = 5) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+
+class PackedWorkspaceIndex(WorkspaceIndex):
+    """Read view over a small workspace's slice of its pack shard."""
+
+    def __init__(self, workspace_id: int, version: int, vectors: int, shard):
+        super().__init__(workspace_id, version, [])
+        self.vectors = vectors
+        self.shard = shard
+
+    @property
+    def ntotal(self) -> int:
+        return self.vectors
+
+    def similarity_search_with_score_by_vector(self, vector: list[float], k: int = 5):
+        # Vectors are stored exactly, so there is nothing to re-rank
+        return self.shard.search(self.workspace_id, np.asarray([vector], dtype=np.float32), k)
+
+
+def load_workspace_index(workspace_id: int) -> WorkspaceIndex | None:
+    for attempt in range(2):
+        manifest = read_manifest(workspace_id)
+        if manifest is None:
+            packed = packed_info(workspace_id)
+            if not packed or not packed["vectors"]:
+                return None
+            return PackedWorkspaceIndex(workspace_id, packed["version"], packed["vectors"],
+                                        pack_store.shard(workspace_id))
+        if not manifest["segments"]:
+            return None
+        try:
+            segments = [load_segment(workspace_id, s["name"]) for s in manifest["segments"]]
+            return WorkspaceIndex(workspace_id, manifest["version"], segments, tombstones(manifest))
+        except (FileNotFoundError, RuntimeError):
+            # A compaction swapped the manifest while we were reading it
+            if attempt:
+                raise
+    return None
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
+
+def embed_query_cached(workspace_id: int, query: str) -> list[float]:
+    key = (workspace_id, normalize_query(query))
+    vector = query_cache.get(key)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        query_cache.put(key, vector)
+    return vector
+
+
+def search_workspace(workspace_id: int, query: str, k: int = 5) -> list[Document]:
+    """Top-k chunks for `query`, served from cache while the workspace index is unchanged."""
+    with span("retrieval", workspace_id=workspace_id, k=k) as current:
+        index = load_workspace_index(workspace_id)
+        if index is None:
+            return []
+
+        key = (workspace_id, index.version, normalize_query(query), k)
+        hits = result_cache.get(key)
+        if hits is not None:
+            current["attrs"]["cache_hit"] = True
+        else:
+            vector = embed_query_cached(workspace_id, query)
+            hits = index.similarity_search_with_score_by_vector(vector, k=k)
+            result_cache.put(key, hits)
+        # Callers may annotate documents, so hand out copies
+        return [doc.model_copy(deep=True) for doc, _ in hits]
+
+
+class WorkspaceRetriever(BaseRetriever):
+    """Retriever that reads the workspace's current segments on every query."""
+
+    workspace_id: int
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        return search_workspace(self.workspace_id, query, k=self.k)
+
+
+# --- Compaction ---
+def needs_upgrade(manifest: dict) -> bool:
+    """True once a workspace is big enough for ANN but its base segment is still brute force."""
+    segments = manifest["segments"]
+    total = sum(s.get("vectors") or 0 for s in segments)
+    return total >= INDEX_ANN_THRESHOLD and segments[0].get("kind", "flat") != INDEX_ANN_KIND
+
+
+def needs_compaction(manifest: dict) -> bool:
+    segments = manifest["segments"]
+    if not segments:
+        return False
+    if needs_upgrade(manifest):
+        return True
+    # Even a single segment is rewritten once enough of it is deleted
+    total = sum(s.get("vectors") or 0 for s in segments)
+    deleted = (manifest.get("tombstones") or {}).get("vectors", 0)
+    if deleted and deleted >= INDEX_COMPACT_DELETED_RATIO * max(total, 1):
+        return True
+    if len(segments) < 2:
+        return False
+    tail_bytes = sum(s.get("bytes") or 0 for s in segments[1:])
+    return len(segments) >= INDEX_COMPACT_SEGMENTS or tail_bytes >= INDEX_COMPACT_BYTES
+
+
+def maybe_compact(workspace_id: int, manifest: dict | None = None):
+    """Schedule a background merge when the workspace passed a compaction threshold."""
+    manifest = manifest or read_manifest(workspace_id)
+    if not manifest or not needs_compaction(manifest):
+        return
+    with _locks_guard:
+        if workspace_id in _compacting:
+            return
+        _compacting.add(workspace_id)
+    _compactor.submit(_compact, workspace_id)
+
+
+def _compact(workspace_id: int):
+    started = time.perf_counter()
+    try:
+        compact_workspace(workspace_id)
+        _compactions["last_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    except Exception as e:
+        _compactions["failures"] += 1
+        print(f"❌ Index compaction failed for workspace {workspace_id}:", e)
+    finally:
+        with _locks_guard:
+            _compacting.discard(workspace_id)
+
+
+def replace_segments(workspace_id: int, names: list[str], codec: str = INDEX_CODEC) -> dict | None:
+    """
+    Rewrite the named segments as one new segment in the current format and
+    swap it into the manifest in place of the first of them.
+    """
+    manifest = read_manifest(workspace_id)
+    deleted = tombstones(manifest) if manifest else ((), ())
+
+    # Segments are immutable, so readers keep using the old ones while we merge.
+    # Chunks of deleted documents are dropped here for good.
+    docs, vectors = _live_chunks(workspace_id, names, deleted)
+    if not docs:
+        return _drop_segments(workspace_id, names)
+
+    # Rebuilding is when a workspace moves from brute force to an ANN index
+    segment = write_segment(workspace_id, vectors, docs, kind=choose_index_kind(len(docs)), codec=codec)
+
+    with workspace_lock(workspace_id):
+        current = read_manifest(workspace_id)
+        present = {s["name"] for s in current["segments"]} if current else set()
+        if not set(names) <= present:
+            # Workspace deleted or segments replaced meanwhile
+            shutil.rmtree(segment_path(workspace_id, segment["name"]), ignore_errors=True)
+            return None
+        # Keep segments appended while we were merging
+        current["segments"] = [
+            segment if s["name"] == names[0] else s
+            for s in current["segments"]
+            if s["name"] == names[0] or s["name"] not in names
+        ]
+        _settle_tombstones(current, deleted)
+        current["version"] += 1
+        write_manifest(workspace_id, current)
+
+    for name in names:
+        segment_cache.pop((workspace_id, name))
+        _remove_segment_files(workspace_id, name)
+    _remove_orphans(workspace_id, keep={s["name"] for s in current["segments"]})
+    return segment
+
+
+def _live_chunks(workspace_id: int, names: list[str], deleted: tuple) -> tuple:
+    """(docs, float32 vectors) of the named segments, without tombstoned chunks."""
+    vectors, docs = [], []
+    for name in names:
+        source = load_segment(workspace_id, name)
+        excluded = set(source.deleted_positions(*deleted).tolist())
+        kept = [(pos, doc) for pos, doc in source.chunks() if pos not in excluded]
+        if kept:
+            vectors.append(source.vectors()[[pos for pos, _ in kept]])
+            docs.extend(doc for _, doc in kept)
+    if not docs:
+        return [], None
+    vectors = np.vstack(vectors)
+    # Quantized segments only reconstruct approximations; prefer the cached originals
+    for i, vector in exact_vectors(docs).items():
+        vectors[i] = vector
+    return docs, vectors
+
+
+def _settle_tombstones(manifest: dict, applied: tuple):
+    """Forget the applied tombstones when the rewrite covered every segment."""
+    if len(manifest["segments"]) == 1:
+        documents, sources = applied
+        stones = manifest.get("tombstones") or {}
+        stones["documents"] = [d for d in stones.get("documents", []) if d not in documents]
+        stones["sources"] = [s for s in stones.get("sources", []) if s not in sources]
+        stones["vectors"] = 0
+        manifest["tombstones"] = stones
+
+
+def _drop_segments(workspace_id: int, names: list[str]):
+    """Every chunk in `names` was deleted: remove the segments without a replacement."""
+    with workspace_lock(workspace_id):
+        current = read_manifest(workspace_id)
+        if current is None:
+            return None
+        current["segments"] = [s for s in current["segments"] if s["name"] not in names]
+        if not current["segments"]:
+            current["tombstones"] = {}
+        current["version"] += 1
+        write_manifest(workspace_id, current)
+    for name in names:
+        segment_cache.pop((workspace_id, name))
+        _remove_segment_files(workspace_id, name)
+    return None
+
+
+def compact_workspace(workspace_id: int) -> int:
+    """Merge every current segment into one. Returns the number of segments merged."""
+    manifest = read_manifest(workspace_id)
+    if not manifest or not needs_compaction(manifest):
+        return 0
+    names = [s["name"] for s in manifest["segments"]]
+    if replace_segments(workspace_id, names) is None:
+        return 0
+
+    _compactions["runs"] += 1
+    _compactions["merged_segments"] += len(names)
+    return len(names)
+
+
+def migrate_workspace(workspace_id: int) -> int:
+    """Convert LangChain pickle segments to the mmap format. Returns the number converted."""
+    manifest = read_manifest(workspace_id)
+    if not manifest:
+        return 0
+    converted = 0
+    for s in manifest["segments"]:
+        if is_legacy(segment_path(workspace_id, s["name"])):
+            converted += int(replace_segments(workspace_id, [s["name"]]) is not None)
+    return converted
+
+
+def requantize_workspace(workspace_id: int, codec: str) -> dict | None:
+    """Rewrite a workspace as one segment stored as `codec`. Returns the bytes before and after."""
+    manifest = read_manifest(workspace_id)
+    if not manifest or not manifest["segments"]:
+        return None
+    before = sum(s.get("bytes") or 0 for s in manifest["segments"])
+    segment = replace_segments(workspace_id, [s["name"] for s in manifest["segments"]], codec=codec)
+    if segment is None:
+        return None
+    return {"bytes_before": before, "bytes_after": segment["bytes"], "codec": segment["codec"]}
+
+
+def pack_workspace(workspace_id: int) -> int | None:
+    """
+    Move a workspace with at most INDEX_PACK_MAX_VECTORS live chunks from its
+    own directory into its pack shard. Returns the number of chunks moved,
+    or None if the workspace was left alone.
+    """
+    manifest = read_manifest(workspace_id)
+    if not manifest:
+        return None
+    total = sum(s.get("vectors") or 0 for s in manifest["segments"])
+    if total > INDEX_PACK_MAX_VECTORS + (manifest.get("tombstones") or {}).get("vectors", 0):
+        return None
+    names = [s["name"] for s in manifest["segments"]]
+    docs, vectors = _live_chunks(workspace_id, names, tombstones(manifest)) if names else ([], None)
+    if len(docs) > INDEX_PACK_MAX_VECTORS:
+        return None
+
+    with workspace_lock(workspace_id):
+        current = read_manifest(workspace_id)
+        if not current or current["version"] != manifest["version"]:
+            # Changed while we were reading it; try again later
+            return None
+        if docs:
+            pack_store.shard(workspace_id).add(workspace_id, docs, vectors, min_version=current["version"])
+        evict_workspace_index(workspace_id)
+        shutil.rmtree(workspace_dir(workspace_id), ignore_errors=True)
+    _promotions["packed"] += 1
+    return len(docs)
+
+
+def measure_cold_load(workspace_id: int) -> dict:
+    """Open every segment from disk, bypassing the cache, and report time and resident cost."""
+    manifest = read_manifest(workspace_id)
+    result = {"segments": 0, "vectors": 0, "load_ms": 0.0, "resident_bytes": 0}
+    if not manifest:
+        return result
+    started = time.perf_counter()
+    for s in manifest["segments"]:
+        segment = open_segment(segment_path(workspace_id, s["name"]), embeddings)
+        result["segments"] += 1
+        result["vectors"] += segment.ntotal
+        result["resident_bytes"] += segment.resident_bytes
+        segment.close()
+    result["load_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def workspace_vectors(workspace_id: int) -> np.ndarray | None:
+    manifest = read_manifest(workspace_id)
+    if not manifest or not manifest["segments"]:
+        return None
+    return np.vstack([load_segment(workspace_id, s["name"]).vectors() for s in manifest["segments"]])
+
+
+def _probe_queries(vectors: np.ndarray, queries: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    # Midpoints of random chunk pairs stand in for queries that land near content
+    pairs = rng.integers(0, len(vectors), size=(min(queries, len(vectors)), 2))
+    probes = (vectors[pairs[:, 0]] + vectors[pairs[:, 1]]) / 2
+    return probes / (np.linalg.norm(probes, axis=1, keepdims=True) + 1e-12)
+
+
+def benchmark_codecs(vectors: np.ndarray, codec: str, kind: str | None = None,
+                     queries: int = 200, k: int = 5) -> dict:
+    """Recall@k of `codec` against exact search, with and without exact re-ranking."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    kind = kind or choose_index_kind(len(vectors))
+    probes = _probe_queries(vectors, queries)
+
+    exact = new_index("flat", vectors)
+    exact.add(vectors)
+    _, truth = exact.search(probes, k)
+
+    index = new_index(kind, vectors, codec)
+    index.add(vectors)
+    _, approx = index.search(probes, k)
+    _, wide = index.search(probes, k * INDEX_RERANK_FACTOR)
+
+    reranked = []
+    for probe, candidates in zip(probes, wide):
+        candidates = candidates[candidates >= 0]
+        order = np.argsort(np.sum((vectors[candidates] - probe) ** 2, axis=1))
+        reranked.append(candidates[order][:k])
+
+    def recall(found):
+        return round(float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])), 4)
+
+    return {
+        "kind": kind,
+        "codec": codec,
+        "recall_at_k": recall(approx),
+        "recall_at_k_reranked": recall(reranked),
+        "bytes": int(faiss.serialize_index(index).nbytes),
+    }
+
+
+def benchmark_index_kinds(vectors: np.ndarray, queries: int = 200, k: int = 5, kinds=INDEX_KINDS) -> dict:
+    """
+    Build each index kind over `vectors` and compare recall@k against brute
+    force, per-query latency, build time and serialized size.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    probes = _probe_queries(vectors, queries)
+
+    exact = new_index("flat", vectors)
+    exact.add(vectors)
+    _, truth = exact.search(probes, k)
+
+    report = {}
+    for kind in kinds:
+        started = time.perf_counter()
+        index = new_index(kind, vectors)
+        index.add(vectors)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        latencies, found = [], []
+        for probe in probes:
+            started = time.perf_counter()
+            _, positions = index.search(probe[None, :], k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append(positions[0])
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+
+        report[kind] = {
+            "vectors": n,
+            "recall_at_k": round(float(recall), 4),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "build_ms": round(build_ms, 1),
+            "bytes": int(faiss.serialize_index(index).nbytes),
+        }
+    return report
+
+
+def workspace_ids() -> list[int]:
+    if not os.path.isdir(INDEX_DIR):
+        return []
+    return sorted(int(name) for name in os.listdir(INDEX_DIR) if name.isdigit())
+
+
+def _remove_segment_files(workspace_id: int, name: str):
+    if name == LEGACY_SEGMENT:
+        for f in LEGACY_FILES:
+            try:
+                os.remove(os.path.join(workspace_dir(workspace_id), f))
+            except FileNotFoundError:
+                pass
+    else:
+        shutil.rmtree(segment_path(workspace_id, name), ignore_errors=True)
+
+
+def _remove_orphans(workspace_id: int, keep: set):
+    """Drop segment directories left behind by uploads that crashed before publishing."""
+    root = os.path.join(workspace_dir(workspace_id), SEGMENTS_DIR)
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - 3600
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name not in keep and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# --- Deletion ---
+def delete_document_vectors(workspace_id: int, document_id: int, source: str | None = None) -> int:
+    """
+    Tombstone a document's chunks so searches skip them right away; the
+    compactor removes them from disk. `source` also matches chunks indexed
+    before document ids were recorded. Packed workspaces delete the rows
+    outright. Returns the number of chunks hidden.
+    """
+    with workspace_lock(workspace_id):
+        manifest = read_manifest(workspace_id)
+        if manifest is None:
+            # Packed workspaces delete their rows directly
+            shard = pack_store.shard(workspace_id, create=False)
+            removed = shard.remove(workspace_id, [document_id], [source] if source else []) if shard else 0
+            if removed:
+                result_cache.invalidate(lambda key: key[0] == workspace_id)
+            return removed
+        stones = manifest.get("tombstones") or {}
+        documents = set(stones.get("documents", [])) | {document_id}
+        sources = set(stones.get("sources", [])) | ({source} if source else set())
+
+        hidden = 0
+        for s in manifest["segments"]:
+            segment = load_segment(workspace_id, s["name"])
+            before = len(segment.deleted_positions(*tombstones(manifest)))
+            after = len(segment.deleted_positions(tuple(sorted(documents)), tuple(sorted(sources))))
+            hidden += after - before
+
+        manifest["tombstones"] = {
+            "documents": sorted(documents),
+            "sources": sorted(sources),
+            "vectors": stones.get("vectors", 0) + hidden,
+        }
+        manifest["version"] += 1
+        write_manifest(workspace_id, manifest)
+
+    maybe_compact(workspace_id, manifest)
+    return hidden
+
+
+def delete_workspace_index(workspace_id: int):
+    """Drop a deleted workspace's caches and remove its index from disk."""
+    evict_workspace_index(workspace_id)
+    with workspace_lock(workspace_id):
+        shutil.rmtree(workspace_dir(workspace_id), ignore_errors=True)
+        shard = pack_store.shard(workspace_id, create=False)
+        if shard is not None:
+            shard.drop(workspace_id)
+
+
+def evict_workspace_index(workspace_id: int):
+    """Forget a workspace's loaded segments and cached queries."""
+    segment_cache.invalidate(lambda key: key[0] == workspace_id)
+    query_cache.invalidate(lambda key: key[0] == workspace_id)
+    result_cache.invalidate(lambda key: key[0] == workspace_id)
+    _segment_loads.pop(workspace_id, None)
+
+
+def get_index_stats() -> dict:
+    workspaces = {}
+    for (ws, name), segment, size in segment_cache.items():
+        entry = workspaces.setdefault(str(ws), {"resident_bytes": 0, "segments": 0, "vectors": 0,
+                                                "legacy_segments": 0, **_segment_loads.get(ws, {})})
+        entry["resident_bytes"] += size
+        entry["segments"] += 1
+        entry["vectors"] += segment.ntotal
+        entry["legacy_segments"] += int(not segment.mmapped)
+    return {
+        **segment_cache.stats(),
+        "compactions": dict(_compactions),
+        "packed": {"enabled": INDEX_PACKED, "max_vectors": INDEX_PACK_MAX_VECTORS,
+                   **_promotions, **pack_store.stats()},
+        "query_cache": query_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "workspaces": workspaces,
+    }
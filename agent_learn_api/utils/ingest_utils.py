@@ -0,0 +1,218 @@
+import os
+import time
+import uuid
+import threading
+from dotenv import load_dotenv, find_dotenv
+from agent_learn_api import db, socket_io
+from agent_learn_api.models.document import Document
+from agent_learn_api.utils.cache_utils import LRUCache
+from agent_learn_api.utils.document_utils import add_to_index
+from agent_learn_api.utils.executor_utils import ExecutorBusyError, WorkspaceExecutor
+from agent_learn_api.utils.index_utils import delete_document_vectors
+from agent_learn_api.utils.agent_utils import invalidate_workspace_agents
+
+load_dotenv(find_dotenv())
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+# Finished jobs kept for the status endpoint
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "500"))
+
+STAGES = ("parse", "chunk", "embed", "index")
+TERMINAL_STATES = ("indexed", "failed")
+# Nothing is published before "index", so documents stopped earlier can simply start over
+RESUMABLE_STATES = ("queued", "parse", "chunk", "embed")
+
+# Uploads to one workspace are indexed in order; workspaces ingest in parallel
+ingest_executor = WorkspaceExecutor("thread", INGEST_WORKERS, INGEST_QUEUE_SIZE, name="ingest")
+jobs = LRUCache(max_entries=INGEST_JOB_HISTORY)
+_resumed = False
+_resume_lock = threading.Lock()
+
+
+def workspace_room(workspace_id: int) -> str:
+    return f"workspace-{workspace_id}"
+
+
+class IngestJob:
+    """Progress of one document through parse, chunk, embed and index."""
+
+    def __init__(self, document_id: int, workspace_id: int, filename: str):
+        self.id = uuid.uuid4().hex
+        self.document_id = document_id
+        self.workspace_id = workspace_id
+        self.filename = filename
+        self.state = "queued"
+        self.stage = None
+        self.detail = {}
+        self.stage_ms = {}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def progress(self) -> float:
+        if self.state == "indexed":
+            return 1.0
+        if self.stage is None:
+            return 0.0
+        return round(STAGES.index(self.stage) / len(STAGES), 2)
+
+    def enter(self, stage: str, **detail):
+        now = time.perf_counter()
+        with self._lock:
+            if stage == self.stage:
+                # Streaming stages report progress once per batch
+                self.detail = detail
+                return
+            self._close_stage(now)
+            self.state = "running"
+            self.stage = stage
+            self.detail = detail
+            self._stage_started = now
+
+    def finish(self, error: Exception | None = None):
+        with self._lock:
+            self._close_stage(time.perf_counter())
+            self.state = "failed" if error else "indexed"
+            self.error = str(error) if error else None
+            self.finished_at = time.time()
+
+    def _close_stage(self, now: float):
+        if self.stage is not None and self._stage_started is not None:
+            self.stage_ms[self.stage] = round((now - self._stage_started) * 1000, 2)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "document_id": self.document_id,
+                "workspace_id": self.workspace_id,
+                "filename": self.filename,
+                "state": self.state,
+                "stage": self.stage,
+                "progress": self.progress,
+                "detail": dict(self.detail),
+                "stage_ms": dict(self.stage_ms),
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+def _emit(job: IngestJob):
+    socket_io.emit("ingest_progress", job.to_dict(), to=workspace_room(job.workspace_id))
+
+
+def _set_document_state(document_id: int, state: str, error: str | None = None) -> bool:
+    """Returns False when the document was deleted while it was being indexed."""
+    doc = Document.query.get(document_id)
+    if doc is None:
+        return False
+    doc.index_state = state
+    doc.index_error = error
+    db.session.commit()
+    return True
+
+
+def _run_job(job: IngestJob, file_path: str, blob_sha: str | None = None):
+    saved_stage = None
+
+    def on_stage(stage, **detail):
+        nonlocal saved_stage
+        job.enter(stage, **detail)
+        # Streaming stages report every batch; the row only records the stage
+        if stage != saved_stage:
+            _set_document_state(job.document_id, stage)
+            saved_stage = stage
+        _emit(job)
+
+    try:
+        add_to_index(file_path, job.workspace_id, on_stage=on_stage, document_id=job.document_id,
+                     blob_sha=blob_sha)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Ingestion failed for document {job.document_id}:", e)
+        job.finish(e)
+        _set_document_state(job.document_id, "failed", str(e)[:2000])
+        _emit(job)
+        raise
+
+    job.finish()
+    if not _set_document_state(job.document_id, "indexed"):
+        # A compaction may have settled the tombstone before this segment was published
+        delete_document_vectors(job.workspace_id, job.document_id)
+    invalidate_workspace_agents(job.workspace_id)
+    _emit(job)
+
+
+def submit_ingest(doc: Document, app) -> IngestJob:
+    """
+    Queue background indexing for a saved Document row.
+    Raises ExecutorBusyError when the ingestion queue is full.
+    """
+    job = IngestJob(doc.id, doc.workspace_id, doc.filename)
+    jobs.put(job.id, job)
+    try:
+        ingest_executor.submit(doc.workspace_id, _run_job, job, doc.file_path, doc.blob_sha, app=app)
+    except Exception:
+        jobs.pop(job.id)
+        raise
+    _emit(job)
+    return job
+
+
+def resume_interrupted_ingests(app) -> dict | None:
+    """
+    Pick up documents a previous run of the server left mid-ingestion, once
+    per process (None on later calls). Those stopped before indexing are
+    queued again; those stopped while indexing may be partly published, so
+    they are marked failed for the user to delete and upload again.
+    """
+    global _resumed
+    # Held throughout, so no upload made meanwhile is mistaken for an interrupted one
+    with _resume_lock:
+        if _resumed:
+            return None
+        _resumed = True
+        return _resume_documents(app)
+
+
+def _resume_documents(app) -> dict:
+    counts = {"requeued": 0, "failed": 0}
+    stuck = Document.query.filter(Document.index_state.notin_(TERMINAL_STATES)).order_by(Document.id).all()
+    for doc in stuck:
+        if doc.index_state in RESUMABLE_STATES and os.path.exists(doc.file_path):
+            doc.index_state = "queued"
+            doc.index_error = None
+            db.session.commit()
+            try:
+                submit_ingest(doc, app)
+                counts["requeued"] += 1
+                continue
+            except ExecutorBusyError:
+                error = "Interrupted by a server restart and the ingestion queue was full; upload it again"
+        elif doc.index_state in RESUMABLE_STATES:
+            error = "Interrupted by a server restart and the uploaded file is gone; upload it again"
+        else:
+            error = "Interrupted by a server restart while indexing; delete it and upload it again"
+        _set_document_state(doc.id, "failed", error)
+        counts["failed"] += 1
+    if stuck:
+        print(f"♻️ Interrupted ingestion: {counts['requeued']} requeued, {counts['failed']} failed")
+    return counts
+
+
+def get_job(job_id: str) -> IngestJob | None:
+    return jobs.get(job_id)
+
+
+def get_ingest_stats() -> dict:
+    running = [job for _, job, _ in jobs.items() if job.state in ("queued", "running")]
+    return {
+        **ingest_executor.stats(),
+        "tracked_jobs": len(jobs),
+        "active_jobs": [job.to_dict() for job in running],
+    }
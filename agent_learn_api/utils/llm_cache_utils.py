@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+from agent_learn_api.utils.cache_utils import LRUCache, SqliteStore
+from agent_learn_api.utils.trace_utils import mark_cache_hit
+
+load_dotenv(find_dotenv())
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_cache.sqlite"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "20000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Prune the SQLite tier every N writes
+LLM_CACHE_PRUNE_EVERY = int(os.getenv("LLM_CACHE_PRUNE_EVERY", "200"))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Hash of the model/parameter string and the whitespace-normalized prompt."""
+    raw = _normalize(llm_string) + "\x00" + _normalize(prompt)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TieredLLMCache(BaseCache):
+    """
+    LangChain cache with an in-memory LRU in front of a SQLite table.
+    Entries older than `ttl` seconds are ignored and the SQLite tier is
+    pruned to `max_rows`. Models built with cache=False skip it entirely;
+    get_chat_model does that for every model sampled above temperature 0.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL, max_rows: int = LLM_CACHE_MAX_ROWS):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory = LRUCache(max_entries=memory_entries)
+        self.store = SqliteStore(path, table="llm_cache")
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = cache_key(prompt, llm_string)
+        entry = self.memory.get(key)
+        if entry is not None:
+            created_at, generations = entry
+            if time.time() - created_at <= self.ttl:
+                mark_cache_hit()
+                return list(generations)
+            self.memory.pop(key)
+
+        raw = self.store.get(key, max_age=self.ttl)
+        if raw is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        payload = json.loads(raw)
+        generations = [loads(item) for item in payload["generations"]]
+        self.memory.put(key, (payload["created_at"], generations))
+        with self._lock:
+            self.disk_hits += 1
+        mark_cache_hit()
+        return list(generations)
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        key = cache_key(prompt, llm_string)
+        created_at = time.time()
+        generations = list(return_val)
+        self.memory.put(key, (created_at, generations))
+        payload = {"created_at": created_at, "generations": [dumps(g) for g in generations]}
+        self.store.set(key, json.dumps(payload))
+
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % LLM_CACHE_PRUNE_EVERY == 0
+        if should_prune:
+            self.store.prune(max_age=self.ttl, max_rows=self.max_rows)
+
+    def clear(self, **kwargs) -> None:
+        self.memory.clear()
+        self.store.clear()
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        with self._lock:
+            return {
+                "memory_hits": memory["hits"],
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": memory["entries"],
+                "disk_entries": self.store.count(),
+                "ttl": self.ttl,
+                "max_rows": self.max_rows,
+            }
+
+
+llm_cache = None
+
+
+def init_llm_cache():
+    """Install the shared cache for every LangChain model in this process."""
+    global llm_cache
+    if not LLM_CACHE_ENABLED or llm_cache is not None:
+        return llm_cache
+    llm_cache = TieredLLMCache()
+    set_llm_cache(llm_cache)
+    return llm_cache
+
+
+def get_llm_cache_stats() -> dict:
+    if llm_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_cache.stats()}
@@ -1,13 +1,14 @@
 import os
 import openai
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
 from langchain.chains.llm_math.base import LLMMathChain
+from agent_learn_api.utils.stream_utils import stream_or_invoke
+from agent_learn_api.utils.client_utils import get_chat_model
 
 load_dotenv(find_dotenv())
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
-model = ChatOpenAI(model="gpt-4o", temperature=0.9)
+model = get_chat_model("gpt-4o", temperature=0.9)
 
 def solve_math(query: str) -> str:
     """
@@ -20,4 +21,4 @@ def solve_math(query: str) -> str:
         return f"Error: {str(e)}"
     
 def normal_llm_answer(query: str) -> str:
-    return model.invoke(query).content
\ No newline at end of file
+    return stream_or_invoke(model, query)
\ No newline at end of file
@@ -0,0 +1,274 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+import faiss
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from langchain.schema import Document
+
+load_dotenv(find_dotenv())
+
+# Small workspaces are spread over this many shard files (fixed once the pack exists)
+INDEX_PACK_SHARDS = int(os.getenv("INDEX_PACK_SHARDS", "64"))
+PACK_CONFIG = "pack.json"
+# Vector ids are (workspace_id << 32) | seq, so each workspace owns one id range
+PACK_ID_BITS = 32
+_READ_BATCH = 4096
+
+
+def workspace_range(workspace_id: int) -> tuple:
+    """[lo, hi) vector ids belonging to `workspace_id`."""
+    return workspace_id << PACK_ID_BITS, (workspace_id + 1) << PACK_ID_BITS
+
+
+class PackShard:
+    """
+    Many small workspaces in one SQLite file, each row holding a chunk and its
+    float32 vector, searched through a single in-memory FAISS index. An
+    IDSelectorRange over the workspace's id range keeps a search inside one
+    workspace. Every write bumps a generation counter so other processes
+    notice the change and reload.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, workspace_id INTEGER NOT NULL, "
+            "document_id INTEGER, doc_id TEXT NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL, "
+            "vector BLOB NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_workspace ON chunks(workspace_id, document_id);"
+            "CREATE TABLE IF NOT EXISTS workspaces (workspace_id INTEGER PRIMARY KEY, "
+            "version INTEGER NOT NULL, vectors INTEGER NOT NULL, next_seq INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS shard (id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO shard (id, generation) VALUES (0, 0);"
+        )
+        self._index = None
+        self._generation = None
+
+    @contextmanager
+    def _write(self):
+        """Write transaction that bumps the generation. Yields the generation it started from."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            generation = self._conn.execute("SELECT generation FROM shard").fetchone()[0]
+            yield generation
+            self._conn.execute("UPDATE shard SET generation = generation + 1")
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _synced(self, generation: int, change):
+        """Apply our own write to the loaded index, or drop it if another process wrote too."""
+        if self._index is not None and self._generation == generation:
+            change(self._index)
+            self._generation = generation + 1
+        else:
+            self._index = None
+
+    def _refresh(self):
+        generation = self._conn.execute("SELECT generation FROM shard").fetchone()[0]
+        if self._index is not None and generation == self._generation:
+            return
+        # One read transaction, so the rows match the generation
+        self._conn.execute("BEGIN")
+        try:
+            generation = self._conn.execute("SELECT generation FROM shard").fetchone()[0]
+            index = None
+            cursor = self._conn.execute("SELECT id, vector FROM chunks")
+            while rows := cursor.fetchmany(_READ_BATCH):
+                ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                vectors = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float32).reshape(len(rows), -1)
+                if index is None:
+                    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+                index.add_with_ids(vectors, ids)
+        finally:
+            self._conn.execute("COMMIT")
+        self._index = index
+        self._generation = generation if index is not None else None
+
+    def workspace(self, workspace_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, vectors FROM workspaces WHERE workspace_id = ?", (workspace_id,)
+            ).fetchone()
+        return {"version": row[0], "vectors": row[1]} if row else None
+
+    def add(self, workspace_id: int, docs: list[Document], vectors, min_version: int = 0) -> dict:
+        """Append chunks to a workspace. Its version ends up above `min_version`."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            with self._write() as generation:
+                row = self._conn.execute(
+                    "SELECT version, vectors, next_seq FROM workspaces WHERE workspace_id = ?", (workspace_id,)
+                ).fetchone()
+                version, count, seq = row or (min_version, 0, 0)
+                lo, _ = workspace_range(workspace_id)
+                ids = np.arange(lo + seq, lo + seq + len(docs), dtype=np.int64)
+                self._conn.executemany(
+                    "INSERT INTO chunks (id, workspace_id, document_id, doc_id, content, metadata, vector) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            int(ids[i]), workspace_id, doc.metadata.get("document_id"), doc.id or uuid.uuid4().hex,
+                            doc.page_content, json.dumps(doc.metadata, default=str), vectors[i].tobytes(),
+                        )
+                        for i, doc in enumerate(docs)
+                    ],
+                )
+                info = {"version": max(version, min_version) + 1, "vectors": count + len(docs)}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO workspaces (workspace_id, version, vectors, next_seq) VALUES (?, ?, ?, ?)",
+                    (workspace_id, info["version"], info["vectors"], seq + len(docs)),
+                )
+            self._synced(generation, lambda index: index.add_with_ids(vectors, ids))
+        return info
+
+    def remove(self, workspace_id: int, document_ids=(), sources=()) -> int:
+        """Delete a workspace's chunks of these documents (or source paths). Returns the count."""
+        clauses, args = [], []
+        if document_ids:
+            clauses.append(f"document_id IN ({','.join('?' * len(document_ids))})")
+            args.extend(document_ids)
+        if sources:
+            clauses.append(f"json_extract(metadata, '$.source') IN ({','.join('?' * len(sources))})")
+            args.extend(sources)
+        if not clauses:
+            return 0
+        with self._lock:
+            with self._write() as generation:
+                ids = [r[0] for r in self._conn.execute(
+                    f"SELECT id FROM chunks WHERE workspace_id = ? AND ({' OR '.join(clauses)})",
+                    (workspace_id, *args),
+                )]
+                if ids:
+                    self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+                    self._conn.execute(
+                        "UPDATE workspaces SET version = version + 1, vectors = vectors - ? WHERE workspace_id = ?",
+                        (len(ids), workspace_id),
+                    )
+            selector = faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64))
+            self._synced(generation, lambda index: index.remove_ids(selector))
+        return len(ids)
+
+    def drop(self, workspace_id: int) -> int:
+        """Remove a workspace from the shard. Returns the number of chunks removed."""
+        lo, hi = workspace_range(workspace_id)
+        with self._lock:
+            with self._write() as generation:
+                removed = self._conn.execute("DELETE FROM chunks WHERE workspace_id = ?", (workspace_id,)).rowcount
+                self._conn.execute("DELETE FROM workspaces WHERE workspace_id = ?", (workspace_id,))
+            self._synced(generation, lambda index: index.remove_ids(faiss.IDSelectorRange(lo, hi)))
+        return removed
+
+    def take(self, workspace_id: int) -> tuple:
+        """(docs, float32 vectors) of every chunk in the workspace, in insertion order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content, metadata, doc_id, vector FROM chunks WHERE workspace_id = ? ORDER BY id",
+                (workspace_id,),
+            ).fetchall()
+        docs = [Document(page_content=r[0], metadata=json.loads(r[1]), id=r[2]) for r in rows]
+        vectors = np.frombuffer(b"".join(r[3] for r in rows), dtype=np.float32).reshape(len(rows), -1)
+        return docs, vectors
+
+    def search(self, workspace_id: int, query: np.ndarray, k: int) -> list:
+        """[(Document, L2 distance)] of the workspace's k nearest chunks."""
+        lo, hi = workspace_range(workspace_id)
+        with self._lock:
+            self._refresh()
+            if self._index is None:
+                return []
+            # Keep the selector referenced for as long as FAISS uses it
+            selector = faiss.IDSelectorRange(lo, hi)
+            params = faiss.SearchParameters(sel=selector)
+            distances, ids = self._index.search(query, k, params=params)
+        hits = [(int(i), float(d)) for d, i in zip(distances[0], ids[0]) if i >= 0]
+        docs = self.fetch([i for i, _ in hits])
+        # Rows deleted since the search are skipped
+        return [(docs[i], d) for i, d in hits if i in docs]
+
+    def fetch(self, ids: list[int]) -> dict:
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, doc_id, content, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+        return {r[0]: Document(page_content=r[2], metadata=json.loads(r[3]), id=r[1]) for r in rows}
+
+    def stats(self) -> dict:
+        with self._lock:
+            workspaces, vectors = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(vectors), 0) FROM workspaces"
+            ).fetchone()
+            index = self._index
+            return {
+                "workspaces": workspaces,
+                "vectors": vectors,
+                "loaded": index is not None,
+                "resident_bytes": index.ntotal * (index.d * 4 + 8) if index is not None else 0,
+            }
+
+
+class PackStore:
+    """The shard files of a pack directory; a workspace always maps to the same shard."""
+
+    def __init__(self, root: str, shards: int = INDEX_PACK_SHARDS):
+        self.root = root
+        self._shards = shards
+        self._open = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def _configure(self, create: bool) -> bool:
+        # Caller holds the lock. The shard count is pinned on disk so a config
+        # change can never strand workspaces in shards nobody looks at.
+        if self._configured:
+            return True
+        path = os.path.join(self.root, PACK_CONFIG)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._shards = json.load(f)["shards"]
+        except FileNotFoundError:
+            if not create:
+                return False
+            os.makedirs(self.root, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"shards": self._shards}, f)
+        self._configured = True
+        return True
+
+    def shard(self, workspace_id: int, create: bool = True) -> PackShard | None:
+        """The workspace's shard, or None if `create` is off and it does not exist yet."""
+        with self._lock:
+            if not self._configure(create):
+                return None
+            name = f"shard-{workspace_id % self._shards:03d}.sqlite"
+            shard = self._open.get(name)
+            if shard is None:
+                path = os.path.join(self.root, name)
+                if not create and not os.path.exists(path):
+                    return None
+                shard = self._open[name] = PackShard(path)
+            return shard
+
+    def stats(self) -> dict:
+        with self._lock:
+            shards = dict(self._open)
+        per_shard = {name: shard.stats() for name, shard in sorted(shards.items())}
+        return {
+            "shards_open": len(per_shard),
+            "workspaces": sum(s["workspaces"] for s in per_shard.values()),
+            "vectors": sum(s["vectors"] for s in per_shard.values()),
+            "resident_bytes": sum(s["resident_bytes"] for s in per_shard.values()),
+            "shards": per_shard,
+        }
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv, find_dotenv
+from pypdf import PdfReader
+from langchain.schema import Document
+
+# Worker processes import this module (and so the agent_learn_api package, which
+# pulls in Flask but builds no app) to extract text; keep model imports out of it
+
+load_dotenv(find_dotenv())
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Smaller PDFs are read in-process; starting work in the pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "48"))
+# Forking the threaded server would copy its held locks and open connections into
+# the workers, so they start fresh. Fresh interpreters re-import the __main__
+# script as __mp_main__, which app.py keeps from building an app.
+PDF_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> list[str]:
+    """Text of pages [start, stop). Runs in a worker process."""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(PDF_START_METHOD))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(PDF_WORKERS)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def iter_pdf_pages(file_path: str, workers: int = PDF_WORKERS, pool: ProcessPoolExecutor | None = None,
+                   min_pages: int = PDF_PARALLEL_MIN_PAGES):
+    """
+    Yield a PDF's pages in order, with the page metadata PyPDFLoader sets.
+    Large files are extracted in page ranges across a process pool (the
+    shared one unless `pool` is given); only a few ranges are in flight at
+    once so memory stays bounded.
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+
+    def page(number: int, text: str) -> Document:
+        return Document(page_content=text, metadata={"source": file_path, "page": number, "total_pages": total})
+
+    if workers <= 1 or total < min_pages:
+        for number, p in enumerate(reader.pages):
+            yield page(number, p.extract_text() or "")
+        return
+    del reader
+
+    shared = pool is None
+    pool = pool or _get_pool()
+    window = 2 * workers
+    ranges = iter([(s, min(s + PDF_PAGES_PER_TASK, total)) for s in range(0, total, PDF_PAGES_PER_TASK)])
+    pending = deque()
+
+    def submit_next():
+        bounds = next(ranges, None)
+        if bounds is not None:
+            pending.append((bounds[0], pool.submit(extract_page_range, file_path, *bounds)))
+
+    try:
+        for _ in range(window):
+            submit_next()
+        while pending:
+            start, future = pending.popleft()
+            try:
+                texts = future.result()
+            except BrokenProcessPool:
+                if shared:
+                    _reset_pool()
+                raise
+            submit_next()
+            for offset, text in enumerate(texts):
+                yield page(start + offset, text)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def benchmark_pdf(file_path: str, worker_counts: list[int]) -> list[dict]:
+    """
+    Time full-text extraction of `file_path` in-process and with each pool
+    size, checking that the parallel output matches the serial one.
+    """
+    rows = []
+    baseline = None
+    for workers in sorted({1, *worker_counts}):
+        pool = _new_pool(workers) if workers > 1 else None
+        try:
+            started = time.perf_counter()
+            pages = [p.page_content for p in iter_pdf_pages(file_path, workers, pool=pool, min_pages=0)]
+            elapsed = time.perf_counter() - started
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if baseline is None:
+            baseline = pages
+        rows.append({
+            "workers": workers,
+            "pages": len(pages),
+            "ms": round(elapsed * 1000, 1),
+            "pages_per_s": round(len(pages) / elapsed, 1) if elapsed else 0.0,
+            "matches_serial": pages == baseline,
+        })
+    return rows
@@ -6,15 +6,16 @@ from dotenv import load_dotenv, find_dotenv
 from pydantic import BaseModel, Field
 from agent_learn_api.models import QuizResult
 from agent_learn_api.models import Question
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
+from agent_learn_api.utils.client_utils import get_chat_model
 
 load_dotenv(find_dotenv())
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-model = ChatOpenAI(model="gpt-4o", temperature=0.9)
+# Questions must vary between calls, so this model opts out of the LLM cache
+model = get_chat_model("gpt-4o", temperature=0.9, cache=False)
 
 class QuestionSchema(BaseModel):
     type: str = Field(description="Type of question: mcq, fill in the blank, open")
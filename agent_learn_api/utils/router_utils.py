@@ -0,0 +1,243 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+ROUTER_CENTROIDS_PATH = os.path.join(CACHE_DIR, "router_centroids.json")
+# Minimum cosine similarity to the best centroid before we trust the local tier
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.80"))
+# Minimum gap between the best and second best centroid
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.03"))
+
+DESTINATIONS = ["quiz_agent", "doc_agent", "mindmap_agent", "google_agent", "chat_agent"]
+
+# --- Tier 1: keyword / regex rules ---
+KEYWORD_RULES = {
+    "quiz_agent": [
+        r"\b(quiz|quizzes|mcqs?)\b",
+        r"\btest me\b",
+        r"\bpractice questions?\b",
+    ],
+    "mindmap_agent": [
+        r"\bmind ?maps?\b",
+        r"\bflow ?charts?\b",
+        r"\bconcept maps?\b",
+    ],
+    "doc_agent": [
+        r"\b(draw|sketch)\b",
+        r"\b(generate|create|make)\b.*\b(image|picture|illustration|pdf)\b",
+        r"\bmy (notes|documents?|files?|uploads?)\b",
+        r"\b(uploaded|attached) (document|file|pdf|notes)\b",
+    ],
+    "google_agent": [
+        r"\b(search|look up)\b.*\b(web|internet|online|google)\b",
+        r"\bgoogle\b",
+        r"\blatest news\b",
+    ],
+    "chat_agent": [
+        r"^\s*(hi|hello|hey|thanks|thank you)\b[\s!.?]*$",
+    ],
+}
+_compiled_rules = {
+    dest: [re.compile(p, re.IGNORECASE) for p in patterns]
+    for dest, patterns in KEYWORD_RULES.items()
+}
+
+# --- Tier 2: example utterances for nearest-centroid classification ---
+ROUTE_EXAMPLES = {
+    "quiz_agent": [
+        "Make a quiz on photosynthesis",
+        "Give me 5 questions to test my knowledge of algebra",
+        "Can you quiz me on the French revolution",
+        "Create multiple choice questions about cell biology",
+    ],
+    "doc_agent": [
+        "Summarize the document I uploaded",
+        "What does my textbook say about thermodynamics",
+        "Create a PDF summary about the water cycle",
+        "Draw an image of a volcano erupting",
+        "Find the definition of osmosis in my notes",
+    ],
+    "mindmap_agent": [
+        "Make a mindmap of world war two",
+        "Create a flowchart for the software development lifecycle",
+        "Break down the topics of organic chemistry as a tree",
+        "Show me a concept map of the solar system",
+    ],
+    "google_agent": [
+        "Search the web for the latest research on black holes",
+        "What is the current population of Japan",
+        "Find recent news about renewable energy",
+        "Look up who won the Nobel prize in physics this year",
+    ],
+    "chat_agent": [
+        "Hello, how are you",
+        "Explain how gravity works",
+        "Solve 2x + 3 = 11",
+        "Thanks, that was helpful",
+        "What is the difference between mitosis and meiosis",
+    ],
+}
+
+
+class RouteDecision:
+    def __init__(self, destination: str, confidence: float, tier: str,
+                 margin: float = 0.0, next_inputs: dict | None = None):
+        self.destination = destination
+        self.confidence = confidence
+        self.tier = tier
+        self.margin = margin
+        self.next_inputs = next_inputs
+
+
+class RouterStats:
+    """Per-tier hit and latency counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.tiers = {
+            name: {"calls": 0, "hits": 0, "latency_ms": 0.0}
+            for name in ["keyword", "centroid", "llm"]
+        }
+
+    def record(self, tier: str, hit: bool, elapsed: float):
+        with self._lock:
+            counters = self.tiers[tier]
+            counters["calls"] += 1
+            counters["hits"] += int(hit)
+            counters["latency_ms"] += elapsed * 1000
+
+    def record_message(self):
+        with self._lock:
+            self.total += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tiers = {}
+            for name, c in self.tiers.items():
+                tiers[name] = {
+                    "calls": c["calls"],
+                    "hits": c["hits"],
+                    "hit_rate": round(c["hits"] / self.total, 4) if self.total else 0.0,
+                    "avg_latency_ms": round(c["latency_ms"] / c["calls"], 2) if c["calls"] else 0.0,
+                }
+            return {
+                "messages": self.total,
+                "confidence_threshold": ROUTER_CONFIDENCE_THRESHOLD,
+                "min_margin": ROUTER_MIN_MARGIN,
+                "tiers": tiers,
+            }
+
+
+router_stats = RouterStats()
+
+
+def keyword_route(query: str) -> RouteDecision | None:
+    """Return a decision only when exactly one destination's rules match."""
+    matches = [
+        dest for dest, patterns in _compiled_rules.items()
+        if any(p.search(query) for p in patterns)
+    ]
+    if len(matches) == 1:
+        return RouteDecision(matches[0], 1.0, "keyword", margin=1.0)
+    return None
+
+
+class CentroidClassifier:
+    """
+    Nearest-centroid classifier over embeddings of ROUTE_EXAMPLES.
+    Centroids are cached on disk and only recomputed when the examples change.
+    """
+
+    def __init__(self, embeddings, examples: dict = ROUTE_EXAMPLES, path: str = ROUTER_CENTROIDS_PATH):
+        self.embeddings = embeddings
+        self.examples = examples
+        self.path = path
+        self._labels = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _examples_hash(self) -> str:
+        model_name = getattr(self.embeddings, "model", "")
+        raw = json.dumps([model_name, self.examples], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        digest = self._examples_hash()
+        centroids = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("hash") == digest:
+                centroids = cached["centroids"]
+
+        if centroids is None:
+            centroids = {}
+            for dest, utterances in self.examples.items():
+                vectors = np.array(self.embeddings.embed_documents(utterances), dtype=np.float32)
+                centroids[dest] = vectors.mean(axis=0).tolist()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"hash": digest, "centroids": centroids}, f)
+
+        labels = list(centroids.keys())
+        matrix = np.array([centroids[d] for d in labels], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._labels, self._matrix = labels, matrix
+
+    def classify(self, query: str) -> RouteDecision:
+        with self._lock:
+            if self._matrix is None:
+                self._load()
+        vector = np.array(self.embeddings.embed_query(query), dtype=np.float32)
+        vector /= np.linalg.norm(vector)
+        scores = self._matrix @ vector
+        order = np.argsort(scores)[::-1]
+        best, second = float(scores[order[0]]), float(scores[order[1]])
+        return RouteDecision(self._labels[order[0]], best, "centroid", margin=best - second)
+
+
+def route_query(query: str, classifier: CentroidClassifier, llm_route) -> RouteDecision:
+    """
+    Tiered routing: keyword rules, then nearest centroid, then the LLM.
+    `llm_route` returns a RouterOutput and is only called when the cheaper
+    tiers are not confident.
+    """
+    router_stats.record_message()
+
+    start = time.perf_counter()
+    decision = keyword_route(query)
+    router_stats.record("keyword", decision is not None, time.perf_counter() - start)
+    if decision:
+        return decision
+
+    start = time.perf_counter()
+    try:
+        decision = classifier.classify(query)
+        confident = (
+            decision.confidence >= ROUTER_CONFIDENCE_THRESHOLD
+            and decision.margin >= ROUTER_MIN_MARGIN
+        )
+    except Exception as e:
+        print("⚠️ Centroid router failed:", e)
+        confident = False
+    router_stats.record("centroid", confident, time.perf_counter() - start)
+    if confident:
+        return decision
+
+    start = time.perf_counter()
+    raw = llm_route(query)
+    router_stats.record("llm", True, time.perf_counter() - start)
+    return RouteDecision(raw.destination, 0.0, "llm", next_inputs=raw.next_inputs)
+
+
+def get_router_stats() -> dict:
+    return router_stats.snapshot()
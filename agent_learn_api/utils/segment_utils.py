@@ -0,0 +1,449 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import math
+import faiss
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from langchain_community.vectorstores.faiss import FAISS
+from langchain.schema import Document
+
+load_dotenv(find_dotenv())
+
+VECTORS_FILE = "vectors.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+# Layout written by LangChain's FAISS.save_local
+LEGACY_FILES = ("index.faiss", "index.pkl")
+
+# Vectors are mapped read-only so pages are shared by every worker on the host
+MMAP_FLAGS = faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+# Per-connection SQLite page cache; chunk text is also read through mmap
+CHUNKS_CACHE_KIB = 256
+CHUNKS_MMAP_BYTES = 64 * 1024 * 1024
+# Python-side cost of an open segment besides its index
+SEGMENT_OVERHEAD_BYTES = CHUNKS_CACHE_KIB * 1024 + 16 * 1024
+
+# Segments with at least this many vectors get an approximate index instead of brute force
+INDEX_ANN_THRESHOLD = int(os.getenv("INDEX_ANN_THRESHOLD", "20000"))
+INDEX_ANN_KIND = os.getenv("INDEX_ANN_KIND", "hnsw")  # "hnsw" or "ivf"
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "80"))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", "64"))
+INDEX_IVF_NPROBE = int(os.getenv("INDEX_IVF_NPROBE", "16"))
+INDEX_KINDS = ("flat", "hnsw", "ivf")
+# Opt-in vector compression: "none", "sq8" (4x smaller) or "pq" (~64x smaller)
+INDEX_CODEC = os.getenv("INDEX_CODEC", "none")
+INDEX_CODECS = ("none", "sq8", "pq")
+# PQ codebooks need enough training vectors; smaller segments fall back to SQ8
+INDEX_PQ_MIN_TRAIN = int(os.getenv("INDEX_PQ_MIN_TRAIN", "10000"))
+
+
+# --- Index types ---
+def choose_index_kind(vectors: int) -> str:
+    return INDEX_ANN_KIND if vectors >= INDEX_ANN_THRESHOLD else "flat"
+
+
+def ivf_nlist(vectors: int) -> int:
+    # ~4*sqrt(n) lists, but keep at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(vectors)), vectors // 39))
+
+
+def pq_subquantizers(d: int) -> int:
+    # One byte per 16 dimensions, rounded down to a divisor of d
+    m = max(1, d // 16)
+    while d % m:
+        m -= 1
+    return m
+
+
+def effective_codec(codec: str, vectors: int) -> str:
+    if codec == "pq" and vectors < INDEX_PQ_MIN_TRAIN:
+        return "sq8"
+    return codec
+
+
+def new_index(kind: str, vectors: np.ndarray, codec: str = "none"):
+    """
+    Empty FAISS index of `kind` storing vectors as `codec`, trained on
+    `vectors` when the type needs it.
+    """
+    d = vectors.shape[1]
+    codec = effective_codec(codec, len(vectors))
+    if codec not in INDEX_CODECS:
+        raise ValueError(f"Unknown index codec: {codec}")
+
+    if kind == "flat":
+        index = {
+            "none": lambda: faiss.IndexFlatL2(d),
+            "sq8": lambda: faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit),
+            "pq": lambda: faiss.IndexPQ(d, pq_subquantizers(d), 8),
+        }[codec]()
+    elif kind == "hnsw":
+        index = {
+            "none": lambda: faiss.IndexHNSWFlat(d, INDEX_HNSW_M),
+            "sq8": lambda: faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_8bit, INDEX_HNSW_M),
+            "pq": lambda: faiss.IndexHNSWPQ(d, pq_subquantizers(d), INDEX_HNSW_M),
+        }[codec]()
+        index.hnsw.efConstruction = INDEX_HNSW_EF_CONSTRUCTION
+    elif kind == "ivf":
+        storage = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_subquantizers(d)}"}[codec]
+        index = faiss.index_factory(d, f"IVF{ivf_nlist(len(vectors))},{storage}")
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    tune_index(index)
+    return index
+
+
+def index_kind(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    return "flat"
+
+
+def index_codec(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        index = ivf
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def tune_index(index):
+    """Apply search-time parameters, which are not all kept in the index file."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = INDEX_HNSW_EF_SEARCH
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(INDEX_IVF_NPROBE, ivf.nlist)
+
+
+def search_params(index, excluded: np.ndarray):
+    """Search parameters that skip the `excluded` vector positions."""
+    inner = faiss.IDSelectorBatch(np.ascontiguousarray(excluded, dtype=np.int64))
+    selector = faiss.IDSelectorNot(inner)
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=INDEX_HNSW_EF_SEARCH)
+    elif faiss.try_extract_index_ivf(index) is not None:
+        ivf = faiss.try_extract_index_ivf(index)
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=min(INDEX_IVF_NPROBE, ivf.nlist))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # The wrappers do not own their selectors; keep them alive with the params
+    params._selectors = (inner, selector)
+    return params
+
+
+def supports_selector(index) -> bool:
+    # IndexPQ::search only takes SearchParametersPQ and rejects any selector
+    return not isinstance(index, faiss.IndexPQ)
+
+
+def _search_excluding(index, queries: np.ndarray, k: int, excluded: np.ndarray):
+    """Unfiltered search over k + len(excluded) results, dropping the excluded positions after."""
+    distances, positions = index.search(queries, min(k + len(excluded), index.ntotal))
+    out_d = np.full((len(queries), k), np.finfo(np.float32).max, dtype=np.float32)
+    out_p = np.full((len(queries), k), -1, dtype=np.int64)
+    for row in range(len(queries)):
+        keep = (positions[row] >= 0) & ~np.isin(positions[row], excluded)
+        found = positions[row][keep][:k]
+        out_p[row, :len(found)] = found
+        out_d[row, :len(found)] = distances[row][keep][:k]
+    return out_d, out_p
+
+
+def _search(index, queries: np.ndarray, k: int, excluded: np.ndarray | None):
+    k = min(k, index.ntotal)
+    if excluded is None or not len(excluded):
+        return index.search(queries, k)
+    if not supports_selector(index):
+        return _search_excluding(index, queries, k, excluded)
+    return index.search(queries, k, params=search_params(index, excluded))
+
+
+def index_bytes(index) -> int:
+    """
+    Memory an index in use occupies: its vector codes, which searches touch
+    even when mapped, plus the HNSW graph (2*M int32 links per vector at level
+    0) or the IVF ids, which are read into memory.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        return index.ntotal * (storage.code_size + index.hnsw.nb_neighbors(0) * 4)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return index.ntotal * (ivf.code_size + 8)
+    return index.ntotal * getattr(index, "code_size", index.d * 4)
+
+
+def reconstruct_all(index) -> np.ndarray:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def is_legacy(path: str) -> bool:
+    return not os.path.exists(os.path.join(path, VECTORS_FILE)) and os.path.exists(os.path.join(path, LEGACY_FILES[0]))
+
+
+class Segment:
+    """
+    One immutable on-disk segment: a FAISS index opened with mmap and a
+    SQLite table of chunks keyed by vector position, read per search hit.
+    `close` releases both; a search still holding the segment reopens them.
+    """
+
+    mmapped = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.index = self._conn = None
+        with self._lock:
+            self._open()
+        self.kind = index_kind(self.index)
+        self.codec = index_codec(self.index)
+        self._ntotal = self.index.ntotal
+        self._resident_bytes = index_bytes(self.index) + SEGMENT_OVERHEAD_BYTES
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        # Segments written before deletions were tracked only carry the id in metadata
+        self._document_column = (
+            "document_id" if "document_id" in columns else "json_extract(metadata, '$.document_id')"
+        )
+        self._deleted = (None, np.empty(0, dtype=np.int64))
+
+    def _open(self):
+        # Caller holds the lock
+        if self._conn is not None:
+            return
+        self.index = faiss.read_index(os.path.join(self.path, VECTORS_FILE), MMAP_FLAGS)
+        tune_index(self.index)
+        uri = "file:" + os.path.abspath(os.path.join(self.path, CHUNKS_FILE)) + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA cache_size=-{CHUNKS_CACHE_KIB}")
+        self._conn.execute(f"PRAGMA mmap_size={CHUNKS_MMAP_BYTES}")
+
+    def _index(self):
+        with self._lock:
+            self._open()
+            return self.index
+
+    def close(self):
+        """Release the connection and the index (and with it the mapped file)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self.index = self._conn = None
+
+    @property
+    def ntotal(self) -> int:
+        return self._ntotal
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._resident_bytes
+
+    def search(self, queries: np.ndarray, k: int, excluded: np.ndarray | None = None):
+        """Distances and vector positions for each query row, like faiss.Index.search."""
+        return _search(self._index(), queries, k, excluded)
+
+    def deleted_positions(self, documents: tuple = (), sources: tuple = ()) -> np.ndarray:
+        """Vector positions of chunks from tombstoned document ids or source files."""
+        key = (documents, sources)
+        if not documents and not sources:
+            return np.empty(0, dtype=np.int64)
+        if self._deleted[0] == key:
+            return self._deleted[1]
+        clauses, args = [], []
+        if documents:
+            clauses.append(f"{self._document_column} IN ({','.join('?' * len(documents))})")
+            args.extend(documents)
+        if sources:
+            clauses.append(f"json_extract(metadata, '$.source') IN ({','.join('?' * len(sources))})")
+            args.extend(sources)
+        with self._lock:
+            self._open()
+            rows = self._conn.execute(f"SELECT pos FROM chunks WHERE {' OR '.join(clauses)}", args).fetchall()
+        positions = np.asarray([r[0] for r in rows], dtype=np.int64)
+        self._deleted = (key, positions)
+        return positions
+
+    def fetch(self, positions: list[int]) -> dict:
+        """{position: Document} for the requested vector positions."""
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        with self._lock:
+            self._open()
+            rows = self._conn.execute(
+                f"SELECT pos, doc_id, content, metadata FROM chunks WHERE pos IN ({placeholders})",
+                [int(p) for p in positions],
+            ).fetchall()
+        return {
+            pos: Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+            for pos, doc_id, content, metadata in rows
+        }
+
+    def chunks(self):
+        """Every (position, Document) in vector order."""
+        with self._lock:
+            self._open()
+            rows = self._conn.execute("SELECT pos, doc_id, content, metadata FROM chunks ORDER BY pos").fetchall()
+        for pos, doc_id, content, metadata in rows:
+            yield pos, Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+
+    def vectors(self) -> np.ndarray:
+        return reconstruct_all(self._index())
+
+
+class LegacySegment:
+    """Read-only adapter over a LangChain FAISS directory (index.faiss + index.pkl)."""
+
+    mmapped = False
+    kind = "flat"
+    codec = "none"
+
+    def __init__(self, path: str, embeddings):
+        self.path = path
+        self.store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        self.index = self.store.index
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def resident_bytes(self) -> int:
+        vectors = self.index.ntotal * self.index.d * 4
+        docs = sum(
+            len(doc.page_content) + len(str(doc.metadata))
+            for doc in getattr(self.store.docstore, "_dict", {}).values()
+        )
+        return vectors + docs + 64 * len(self.store.index_to_docstore_id)
+
+    def search(self, queries: np.ndarray, k: int, excluded: np.ndarray | None = None):
+        return _search(self.index, queries, k, excluded)
+
+    def deleted_positions(self, documents: tuple = (), sources: tuple = ()) -> np.ndarray:
+        if not documents and not sources:
+            return np.empty(0, dtype=np.int64)
+        documents, sources = set(documents), set(sources)
+        return np.asarray([
+            pos for pos, doc in self.chunks()
+            if doc.metadata.get("document_id") in documents or doc.metadata.get("source") in sources
+        ], dtype=np.int64)
+
+    def fetch(self, positions: list[int]) -> dict:
+        found = {}
+        for pos in positions:
+            doc_id = self.store.index_to_docstore_id.get(int(pos))
+            doc = self.store.docstore.search(doc_id) if doc_id is not None else None
+            if isinstance(doc, Document):
+                found[pos] = Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+        return found
+
+    def chunks(self):
+        found = self.fetch(range(self.ntotal))
+        for pos in range(self.ntotal):
+            if pos in found:
+                yield pos, found[pos]
+
+    def vectors(self) -> np.ndarray:
+        return self.index.reconstruct_n(0, self.ntotal)
+
+    def close(self):
+        # Everything is in memory; it goes once the last reference does
+        pass
+
+
+def open_segment(path: str, embeddings):
+    if is_legacy(path):
+        return LegacySegment(path, embeddings)
+    return Segment(path)
+
+
+class SegmentWriter:
+    """
+    Builds a segment directory from batches of chunks. Chunk rows go straight
+    to SQLite and vectors to a spill file, so batches can be dropped once
+    added; the index is built from the spill file in `finish`.
+    """
+
+    SPILL_FILE = "vectors.f32"
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.count = 0
+        self.dim = None
+        self.document_ids = set()
+        self._spill = open(os.path.join(path, self.SPILL_FILE), "wb")
+        self._conn = sqlite3.connect(os.path.join(path, CHUNKS_FILE))
+        self._conn.execute(
+            "CREATE TABLE chunks (pos INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, "
+            "document_id INTEGER, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+
+    def add(self, docs: list[Document], vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) != len(docs):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(docs)} chunks")
+        if not len(docs):
+            return
+        self.dim = self.dim or vectors.shape[1]
+        self._spill.write(vectors.tobytes())
+        self._conn.executemany(
+            "INSERT INTO chunks (pos, doc_id, document_id, content, metadata) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    self.count + i, doc.id or uuid.uuid4().hex, doc.metadata.get("document_id"),
+                    doc.page_content, json.dumps(doc.metadata, default=str),
+                )
+                for i, doc in enumerate(docs)
+            ],
+        )
+        self.document_ids.update(doc.metadata.get("document_id") for doc in docs)
+        self.count += len(docs)
+
+    def finish(self, kind: str = "flat", codec: str = "none") -> str:
+        """Index the spilled vectors as `kind`/`codec`. Returns the codec actually used."""
+        self._conn.execute("CREATE INDEX chunks_document ON chunks(document_id)")
+        self._conn.commit()
+        self._conn.close()
+        self._spill.close()
+
+        spill_path = os.path.join(self.path, self.SPILL_FILE)
+        vectors = np.memmap(spill_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        index = new_index(kind, vectors, codec)
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(self.path, VECTORS_FILE))
+        del vectors
+        os.remove(spill_path)
+        return index_codec(index)
+
+    def abort(self):
+        self._conn.close()
+        self._spill.close()
+
+
+def write_segment_files(path: str, vectors: np.ndarray, docs: list[Document],
+                        kind: str = "flat", codec: str = "none") -> str:
+    """
+    Write `docs` and their vectors as a segment directory at `path`, indexed
+    as `kind` and stored as `codec`. Returns the codec actually used.
+    """
+    writer = SegmentWriter(path)
+    writer.add(docs, vectors)
+    return writer.finish(kind, codec)
@@ -0,0 +1,78 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Active sink for the current agent run (None when not streaming)
+_current_sink = contextvars.ContextVar("stream_sink", default=None)
+
+
+class StreamSink:
+    """Collects streamed text chunks for one message and times them."""
+
+    def __init__(self, on_chunk):
+        self.on_chunk = on_chunk
+        self.seq = 0
+        self.started_at = time.perf_counter()
+        self.first_chunk_at = None
+        self.finished_at = None
+
+    def push(self, text: str):
+        if not text:
+            return
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+        self.seq += 1
+        self.on_chunk(text, self.seq)
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def ttft_ms(self) -> int | None:
+        if self.first_chunk_at is None:
+            return None
+        return int((self.first_chunk_at - self.started_at) * 1000)
+
+    @property
+    def generation_ms(self) -> int:
+        end = self.finished_at or time.perf_counter()
+        return int((end - self.started_at) * 1000)
+
+
+@contextmanager
+def stream_to(on_chunk):
+    """Route chunks produced inside this block to `on_chunk(text, seq)`."""
+    sink = StreamSink(on_chunk)
+    token = _current_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        sink.finish()
+        _current_sink.reset(token)
+
+
+def current_sink() -> StreamSink | None:
+    return _current_sink.get()
+
+
+def _chunk_text(chunk) -> str:
+    if hasattr(chunk, "content"):
+        return chunk.content or ""
+    return chunk if isinstance(chunk, str) else str(chunk)
+
+
+def stream_or_invoke(runnable, inputs) -> str:
+    """
+    Run a model or chain and return its text. When a sink is active the
+    model's streaming API is used and each chunk is pushed as it arrives.
+    """
+    sink = current_sink()
+    if sink is None:
+        return _chunk_text(runnable.invoke(inputs))
+
+    parts = []
+    for chunk in runnable.stream(inputs):
+        text = _chunk_text(chunk)
+        parts.append(text)
+        sink.push(text)
+    return "".join(parts)
@@ -0,0 +1,244 @@
+import os
+import json
+import math
+import time
+import uuid
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+load_dotenv(find_dotenv())
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join("traces", "spans.jsonl"))
+# The span log is rotated to <path>.1 once it reaches this size (0 keeps one growing file)
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+# Durations kept per span kind for in-process percentiles
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "5000"))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize_spans(spans) -> dict:
+    """p50/p95/p99 duration, token and cache-hit totals per span kind."""
+    durations = defaultdict(list)
+    totals = defaultdict(lambda: {"tokens": 0, "cache_hits": 0, "errors": 0})
+    for s in spans:
+        kind = s["kind"]
+        durations[kind].append(s["duration_ms"])
+        attrs = s.get("attrs", {})
+        totals[kind]["tokens"] += attrs.get("total_tokens", 0) or 0
+        totals[kind]["cache_hits"] += int(bool(attrs.get("cache_hit")))
+        totals[kind]["errors"] += int(s.get("status") == "error")
+
+    report = {}
+    for kind, values in durations.items():
+        report[kind] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+            **totals[kind],
+        }
+    return report
+
+
+class SpanAggregator:
+    """Keeps the most recent spans of each kind in memory."""
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self._lock = threading.Lock()
+        self._spans = defaultdict(lambda: deque(maxlen=window))
+
+    def add(self, span: dict):
+        with self._lock:
+            self._spans[span["kind"]].append(span)
+
+    def report(self) -> dict:
+        with self._lock:
+            spans = [s for kind_spans in self._spans.values() for s in kind_spans]
+        return summarize_spans(spans)
+
+
+class JsonlSink:
+    """Appends spans to a JSON-lines file, keeping one rotated file beside it."""
+
+    def __init__(self, path: str = TRACE_LOG_PATH, max_bytes: int = TRACE_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def add(self, span: dict):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                size = f.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+
+
+aggregator = SpanAggregator()
+_sinks = [aggregator]
+if TRACE_LOG_PATH:
+    _sinks.append(JsonlSink())
+
+
+def _open_span(kind: str, name: str, attrs: dict) -> dict:
+    parent = _current_span.get()
+    return {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "kind": kind,
+        "name": name,
+        "start": time.time(),
+        "_t0": time.perf_counter(),
+        "_parent": parent,
+        "status": "ok",
+        "attrs": dict(attrs),
+    }
+
+
+def _close_span(span: dict, error: Exception | None = None):
+    span["duration_ms"] = round((time.perf_counter() - span.pop("_t0")) * 1000, 3)
+    parent = span.pop("_parent")
+    if error is not None:
+        span["status"] = "error"
+        span["attrs"]["error"] = str(error)[:500]
+
+    # Roll token and cache-hit counts up so parent spans show what they spent
+    if parent is not None:
+        attrs = parent["attrs"]
+        attrs["total_tokens"] = attrs.get("total_tokens", 0) + span["attrs"].get("total_tokens", 0)
+        attrs["cache_hits"] = (
+            attrs.get("cache_hits", 0) + span["attrs"].get("cache_hits", 0)
+            + int(bool(span["attrs"].get("cache_hit")))
+        )
+
+    if not TRACE_ENABLED:
+        return
+    for sink in _sinks:
+        try:
+            sink.add(span)
+        except Exception as e:
+            print("⚠️ Trace sink failed:", e)
+
+
+@contextmanager
+def span(kind: str, name: str | None = None, **attrs):
+    """Time a block as a span of `kind`, nested under the current span."""
+    current = _open_span(kind, name or kind, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        _current_span.reset(token)
+        _close_span(current, e)
+        raise
+    else:
+        _current_span.reset(token)
+        _close_span(current)
+
+
+def traced(kind: str, name: str | None = None):
+    """Decorator form of span()."""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with span(kind, name or fn.__name__):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+
+def mark_cache_hit():
+    """Flag the innermost open span (the model call) as served from cache."""
+    current = _current_span.get()
+    if current is not None:
+        current["attrs"]["cache_hit"] = True
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Opens an "llm" span around every chat model call and records token usage."""
+
+    def __init__(self):
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def _start(self, serialized, run_id, invocation_params=None):
+        params = invocation_params or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "llm")
+        current = _open_span("llm", str(model), {"model": model})
+        token = _current_span.set(current)
+        with self._lock:
+            self._open[run_id] = (current, token)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs.get("invocation_params"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs.get("invocation_params"))
+
+    def _finish(self, run_id, error=None, response=None):
+        with self._lock:
+            entry = self._open.pop(run_id, None)
+        if entry is None:
+            return
+        current, token = entry
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Finished in a different context than it started in
+            _current_span.set(current["_parent"])
+
+        # Cached responses did not spend tokens
+        if response is not None and not current["attrs"].get("cache_hit"):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if not usage:
+                for generations in response.generations:
+                    for g in generations:
+                        meta = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                        usage = {
+                            "prompt_tokens": meta.get("input_tokens", 0),
+                            "completion_tokens": meta.get("output_tokens", 0),
+                            "total_tokens": meta.get("total_tokens", 0),
+                        }
+            current["attrs"]["prompt_tokens"] = usage.get("prompt_tokens", 0)
+            current["attrs"]["completion_tokens"] = usage.get("completion_tokens", 0)
+            current["attrs"]["total_tokens"] = usage.get("total_tokens", 0)
+        _close_span(current, error)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response=response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=error)
+
+
+tracing_handler = TracingCallbackHandler()
+
+
+def get_trace_report() -> dict:
+    return aggregator.report()
+
+
+def report_from_file(path: str = TRACE_LOG_PATH) -> dict:
+    """Summarize a span log, reading it a line at a time."""
+    with open(path, "r", encoding="utf-8") as f:
+        return summarize_spans(json.loads(line) for line in f if line.strip())
@@ -3,14 +3,14 @@ import openai
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
+from agent_learn_api.utils.client_utils import get_chat_model
 
 load_dotenv(find_dotenv())
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
-model = ChatOpenAI(model="gpt-4o", temperature=0.9)
+model = get_chat_model("gpt-4o", temperature=0.9)
 
 
 class TreeMapNode(BaseModel):